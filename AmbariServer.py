@@ -3,7 +3,8 @@ from __future__ import print_function
 
 
 #exports
-__all__ = ("AmbariServer", )
+__all__ = ("AmbariServer",
+           "AsyncAmbariServer", )
 
 import json
 import sys
@@ -13,6 +14,7 @@ if sys.version_info.major >= 3:
 else:
     from urllib import quote
 
+from AsyncRestServer import AsyncRestServer
 from RestServer import RestServer
 
 
@@ -58,6 +60,17 @@ def get_alert_url(cluster, alert_id=None):
         return quote("/clusters/%s/alert_definitions/%d" % (cluster, alert_id))
 
 
+def format_components(titles, widths, rows):
+    """ format (name, [component, ...]) rows as a text table """
+    format = " ".join("%%-%ds" % w for w in widths)
+    lines = [format % titles,
+             format % tuple("-" * w for w in widths)]
+    for name, components in rows:
+        lines.append(format % (name, ",".join(components)))
+
+    return "\n".join(lines)
+
+
 url_for = {
     "cluster": get_cluster_url,
     "host": get_host_url,
@@ -70,6 +83,8 @@ url_for = {
 
 class AmbariServer(RestServer):
     rootpath = "/api/v1"
+    cache_ttls = ((r"/alert_definitions", 300),
+                  (r"/requests", 0))
 
     def __init__(self, opts):
         super(AmbariServer, self).__init__(opts)
@@ -214,18 +229,15 @@ class AmbariServer(RestServer):
         else:
             hosts = [hostname]
 
-        format = "%-30s %-30s"
-        lines = [format % ("HOST","COMPONENT"),
-                 format % ("------------------------------",
-                           "------------------------------")]
+        rows = []
         for host in hosts:
             comp_url = self.weburl + url_for["host_component"](cluster, host)
 
             components = [item["HostRoles"]["component_name"]
                           for item in self.Get(comp_url)["items"]]
-            lines.append(format % (host, ",".join(components)))
+            rows.append((host, components))
 
-        return '\n'.join(lines)
+        return format_components(("HOST", "COMPONENT"), (30, 30), rows)
 
     def list_services(self, cluster, service=None):
         """ get all services for a cluster """
@@ -236,17 +248,14 @@ class AmbariServer(RestServer):
         else:
             services = [service]
 
-        format = "%-20s %-30s"
-        lines = [format % ("SERVICE", "COMPONENT"),
-                 format % ("--------------------",
-                           "------------------------------", )]
+        rows = []
         for service in services:
             url = self.weburl + url_for["service"](cluster, service)
             components = [item["ServiceComponentInfo"]["component_name"]
                           for item in self.Get(url)["components"]]
-            lines.append(format % (service, ",".join(components)))
+            rows.append((service, components))
 
-        return "\n".join(lines)
+        return format_components(("SERVICE", "COMPONENT"), (20, 30), rows)
 
     def service_action(self, action, cluster=None, service=None):
         """ start/stop a service"""
@@ -336,6 +345,83 @@ class AmbariServer(RestServer):
         return self.Put(url, data=data)
 
 
+class AsyncAmbariServer(AsyncRestServer, AmbariServer):
+    """ AmbariServer with awaitable requests, fanning out per host/service """
+
+    async def list_alerts(self, cluster):
+        """ get all alerts for a cluster """
+        result = await self.Get(self.weburl + url_for["alert"](cluster))
+
+        lines = []
+        for item in result["items"]:
+            alert = item["AlertDefinition"]
+            lines.append((alert["id"], alert["name"], alert["label"]))
+
+        return [("ALERTID", "NAME", "LABEL"), lines]
+
+    async def list_hosts(self, cluster=None):
+        """ get all hosts for a cluster """
+        if cluster is None:
+            url = self.weburl + "/hosts"
+        else:
+            url = self.weburl + url_for["host"](cluster)
+
+        result = await self.Get(url)
+
+        lines = []
+        for item in result["items"]:
+            host = item["Hosts"]
+            lines.append((host["cluster_name"], host["host_name"]))
+
+        return [("CLUSTER", "HOST"), lines]
+
+    async def get_host_components(self, cluster, hostname):
+        """ get the component names of a host """
+        url = self.weburl + url_for["host_component"](cluster, hostname)
+        result = await self.Get(url)
+
+        return [item["HostRoles"]["component_name"]
+                for item in result["items"]]
+
+    async def list_host_components(self, cluster, hostname=None):
+        """ get all components for a specific host in a specific cluster"""
+        if hostname is None:
+            result = await self.Get(self.weburl + url_for["host"](cluster))
+            hosts = [item["Hosts"]["host_name"] for item in result["items"]]
+        else:
+            hosts = [hostname]
+
+        components = await self.gather(
+            self.get_host_components(cluster, host) for host in hosts)
+
+        return format_components(("HOST", "COMPONENT"), (30, 30),
+                                 zip(hosts, components))
+
+    async def get_service_components(self, cluster, service):
+        """ get the component names of a service """
+        result = await self.Get(self.weburl + url_for["service"](cluster,
+                                                                 service))
+
+        return [item["ServiceComponentInfo"]["component_name"]
+                for item in result["components"]]
+
+    async def list_services(self, cluster, service=None):
+        """ get all services for a cluster """
+        if service is None:
+            result = await self.Get(self.weburl + url_for["service"](cluster))
+            services = [item["ServiceInfo"]["service_name"]
+                        for item in result["items"]]
+        else:
+            services = [service]
+
+        components = await self.gather(
+            self.get_service_components(cluster, service)
+            for service in services)
+
+        return format_components(("SERVICE", "COMPONENT"), (20, 30),
+                                 zip(services, components))
+
+
 # ---- main ----
 if __name__ == "__main__":
     print("Ambari")
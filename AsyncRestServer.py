@@ -0,0 +1,63 @@
+#exports
+__all__ = (
+    "AsyncRestServer",
+    "gather", )
+
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
+from RestServer import RestServer
+
+CONCURRENCY = 32  # requests in flight per server
+
+
+async def gather(aws, limit=CONCURRENCY):
+    """ await all the awaitables, at most limit of them at a time """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws))
+
+
+class AsyncRestServer(RestServer):
+    """ base class for the asyncio rest clients
+
+        Request, and so Get/Put/Post/Delete of the subclasses, return
+        awaitables. The blocking transport of RestServer runs on a thread
+        pool sharing the same keep-alive session, so the status code
+        handling is exactly the one of RestServer.Request.
+    """
+
+    def __init__(self, opts):
+        super(AsyncRestServer, self).__init__(opts)
+
+        self.concurrency = getattr(opts, "concurrency", CONCURRENCY)
+        self.pool_maxsize = max(self.pool_maxsize, self.concurrency)
+        self.__executor = None
+
+    @property
+    def executor(self):
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(self.concurrency)
+        return self.__executor
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+        super(AsyncRestServer, self).close()
+
+    async def Request(self, method, url, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(super(AsyncRestServer, self).Request,
+                              method, url, **kwargs))
+
+    async def gather(self, aws, limit=None):
+        return await gather(aws, limit or self.concurrency)
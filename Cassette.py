@@ -0,0 +1,130 @@
+#exports
+__all__ = ("Cassette", )
+
+import base64
+import datetime
+import gzip
+import json
+import threading
+import time
+
+from collections import deque
+
+import requests
+
+from requests.structures import CaseInsensitiveDict
+
+RECORD = "record"
+REPLAY = "replay"
+
+# the body is stored decoded, these would lie about it
+SKIPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+def get_path(url):
+    """ the url without scheme and host, so a cassette replays anywhere """
+    if "://" in url:
+        url = url.split("://", 1)[1]
+        url = "/" + url.split("/", 1)[1] if "/" in url else "/"
+    return url
+
+
+def to_entry(method, url, resp, total):
+    body = resp.content or b""
+    entry = {"m": method,
+             "u": get_path(url),
+             "s": resp.status_code,
+             "h": dict((k, v) for k, v in resp.headers.items()
+                       if k.lower() not in SKIPPED_HEADERS),
+             "e": resp.elapsed.total_seconds(),
+             "t": total}
+    try:
+        entry["b"] = body.decode("utf-8")
+    except UnicodeDecodeError:
+        entry["b64"] = base64.b64encode(body).decode("ascii")
+    return entry
+
+
+def to_response(entry, url):
+    resp = requests.Response()
+    resp.status_code = entry["s"]
+    resp.headers = CaseInsensitiveDict(entry["h"])
+    resp.url = url
+    resp.reason = ""
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    resp.elapsed = datetime.timedelta(seconds=entry["e"])
+    if "b64" in entry:
+        resp._content = base64.b64decode(entry["b64"])
+    else:
+        resp._content = entry["b"].encode("utf-8")
+    resp._content_consumed = True
+    return resp
+
+
+class Cassette(object):
+    """ record the http interactions to a gzipped json lines file, or serve
+        them back in order without any network
+
+        Replayed responses are matched on method and path (with the query),
+        repeated requests get the recorded responses in turn, the last one
+        being reused once they are exhausted.
+    """
+
+    def __init__(self, path, mode=RECORD, realtime=False):
+        self.path = path
+        self.mode = mode
+        self.realtime = realtime
+        self.count = 0
+        self.missed = 0
+
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        if mode == REPLAY:
+            self.load()
+        else:
+            # start a new cassette
+            gzip.open(self.path, "wt").close()
+
+    def load(self):
+        with gzip.open(self.path, "rt") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    key = (entry["m"], entry["u"])
+                    self.__entries.setdefault(key, deque()).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.__entries.values())
+
+    def record(self, send, method, url, **kwargs):
+        start = time.perf_counter()
+        resp = send(method, url, **kwargs)
+        if resp is None:
+            return resp
+
+        # the body has to be read to be recorded, even when streaming
+        entry = to_entry(method, url, resp, time.perf_counter() - start)
+        with self.__lock:
+            with gzip.open(self.path, "at") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self.count += 1
+        return resp
+
+    def replay(self, method, url):
+        with self.__lock:
+            entries = self.__entries.get((method, get_path(url)))
+            if not entries:
+                self.missed += 1
+                return None
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+            self.count += 1
+
+        if self.realtime:
+            time.sleep(entry["t"])
+        return to_response(entry, url)
+
+    def send(self, send, method, url, **kwargs):
+        """ stands for send(method, url, ...) in the transport """
+        if self.mode == REPLAY:
+            return self.replay(method, url)
+        return self.record(send, method, url, **kwargs)
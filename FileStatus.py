@@ -0,0 +1,130 @@
+#exports
+__all__ = (
+    "FileStatus",
+    "FileStatuses", )
+
+import sys
+
+from array import array
+
+# the fields of a FileStatus which are kept, and their default
+FIELDS = (("pathSuffix", "<no name>"),
+          ("type", "FILE"),
+          ("length", 0),
+          ("modificationTime", 0),
+          ("accessTime", 0),
+          ("permission", "000"),
+          ("owner", "<no user>"),
+          ("group", "<no group>"),
+          ("blockSize", 0),
+          ("replication", 0),
+          ("childrenNum", 0))
+
+NAMES = tuple(name for name, _ in FIELDS)
+DEFAULTS = dict(FIELDS)
+
+# few distinct values shared by all the entries
+INTERNED = ("type", "permission", "owner", "group")
+
+# the numeric fields, kept in arrays of 64 bit integers by FileStatuses
+NUMBERS = ("length", "modificationTime", "accessTime", "blockSize",
+           "replication", "childrenNum")
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class FileStatus(object):
+    """ the fields of a webhdfs FileStatus that are used, with the strings
+        shared between the entries
+
+        Reads like the decoded json: fs['length'], fs.get('type').
+    """
+    __slots__ = NAMES
+
+    def __init__(self, **fields):
+        get = fields.get
+        self.pathSuffix = get("pathSuffix")
+        self.type = intern(get("type"))
+        self.length = get("length")
+        self.modificationTime = get("modificationTime")
+        self.accessTime = get("accessTime")
+        self.permission = intern(get("permission"))
+        self.owner = intern(get("owner"))
+        self.group = intern(get("group"))
+        self.blockSize = get("blockSize")
+        self.replication = get("replication")
+        self.childrenNum = get("childrenNum")
+
+    @classmethod
+    def from_json(cls, fs):
+        """ a FileStatus from a decoded json one, None as is """
+        if fs is None or isinstance(fs, cls):
+            return fs
+        return cls(**fs)
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None) if name in DEFAULTS else None
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __eq__(self, other):
+        return isinstance(other, FileStatus) and \
+               all(getattr(self, name) == getattr(other, name)
+                   for name in NAMES)
+
+    def __repr__(self):
+        return "FileStatus(%s)" % ", ".join(
+            "%s=%r" % item for item in self.to_dict().items())
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in NAMES
+                    if getattr(self, name) is not None)
+
+
+class FileStatuses(object):
+    """ FileStatus entries stored by field, the numbers in arrays and the
+        strings interned, for the listings of millions of entries
+
+        Iterating gives FileStatus records, made on the fly. columns are
+        the lists format_columns takes.
+    """
+
+    def __init__(self, statuses=()):
+        self.columns = dict(
+            (name, array("q") if name in NUMBERS else [])
+            for name in NAMES)
+        self.extend(statuses)
+
+    def __len__(self):
+        return len(self.columns["pathSuffix"])
+
+    def append(self, fs):
+        for name, default in FIELDS:
+            value = fs.get(name, default)
+            self.columns[name].append(
+                intern(value) if name in INTERNED else value)
+
+    def extend(self, statuses):
+        for fs in statuses:
+            self.append(fs)
+
+    def __getitem__(self, index):
+        return FileStatus(**dict((name, self.columns[name][index])
+                                 for name in NAMES))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def total_length(self):
+        return sum(self.columns["length"])
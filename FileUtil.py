@@ -1,29 +1,301 @@
-
-
-def getpermission(permission):
-    getbit = lambda bit: {'0' : '---',
-                          '1' : '--x',
-                          '2' : '-w-',
-                          '3' : '-wx',
-                          '4' : 'r--',
-                          '5' : 'r-x',
-                          '6' : 'rw-',
-                          '7' : 'rwx'}.get(bit, '---')
-    return ''.join(map(getbit, permission))
-
-
-def fileinfo(fs):
-    from datetime import datetime
-    ts2str = lambda timestamp: \
-           datetime.fromtimestamp(timestamp * 0.001).strftime("%Y-%m-%d %H:%M")
-
-    return "%s%-10s  %-10s %-10s %8s %s %s" % (
-         'd' if fs.get("type", "FILE") == "DIRECTORY" else '-',
-         getpermission(fs.get("permission", "000")),
-         fs.get("owner", "<no user>"),
-         fs.get("group", "<no group>"),
-         fs.get("length", 0),
-         ts2str(fs.get("modificationTime", 0)),
-         fs.get("pathSuffix", "<no name>"))
-
-
+
+import hashlib
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from datetime import datetime
+
+try:
+    from crc32c import crc32c as crc32c_module
+except ImportError:
+    crc32c_module = None
+
+# without the crc32c module, the CRC32C run in python at a few MB/s
+CRC32C_NATIVE = crc32c_module is not None
+
+MB = 1024.0 * 1024.0
+BYTES_PER_CRC = 512  # dfs.bytes-per-checksum
+
+
+def make_crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ (0x82F63B78 if crc & 1 else 0)
+        table.append(crc)
+    return table
+
+CRC32C_TABLE = make_crc32c_table()
+
+
+def crc32c(data):
+    """ CRC32C (Castagnoli) of data, with the crc32c module if installed """
+    if crc32c_module is not None:
+        return crc32c_module(data)
+
+    table = CRC32C_TABLE
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def file_checksum(filename, block_size, bytes_per_crc=BYTES_PER_CRC,
+                  crc_type='CRC32C'):
+    """ the GETFILECHECKSUM of a local file stored with block_size blocks:
+        MD5 of the MD5s of the CRCs of each bytes_per_crc chunk of a block
+    """
+    crc = crc32c if crc_type == 'CRC32C' else zlib.crc32
+    step = bytes_per_crc * 1024  # read at a time, aligned on the chunks
+    md5s = []
+    with open(filename, 'rb') as f:
+        while True:
+            md5 = hashlib.md5()
+            remaining = block_size
+            while remaining > 0:
+                data = f.read(min(step, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                md5.update(b''.join(
+                    struct.pack('>I', crc(data[i:i + bytes_per_crc]))
+                    for i in range(0, len(data), bytes_per_crc)))
+            if remaining == block_size:
+                break
+            md5s.append(md5.digest())
+            if remaining > 0:
+                break
+
+    crc_per_block = block_size // bytes_per_crc if len(md5s) > 1 else 0
+    return {'algorithm': 'MD5-of-%dMD5-of-%d%s' % (crc_per_block,
+                                                  bytes_per_crc, crc_type),
+            'bytes': (struct.pack('>iq', bytes_per_crc, crc_per_block) +
+                      hashlib.md5(b''.join(md5s)).digest()).hex(),
+            'length': 28}
+
+
+def getpermission(permission):
+    getbit = lambda bit: {'0' : '---',
+                          '1' : '--x',
+                          '2' : '-w-',
+                          '3' : '-wx',
+                          '4' : 'r--',
+                          '5' : 'r-x',
+                          '6' : 'rw-',
+                          '7' : 'rwx'}.get(bit, '---')
+    return ''.join(map(getbit, permission))
+
+
+# the rwx strings of all the 3 digit permissions
+PERMISSIONS = dict((a + b + c, getpermission(a + b + c))
+                   for a in '01234567' for b in '01234567' for c in '01234567')
+
+TIMES_SIZE = 100000  # minutes kept formatted
+times = {}
+
+
+def format_time(timestamp):
+    """ a timestamp in ms as %Y-%m-%d %H:%M, formatted once per minute """
+    minute = timestamp // 60000
+    text = times.get(minute)
+    if text is None:
+        if len(times) >= TIMES_SIZE:
+            times.clear()
+        text = times[minute] = datetime.fromtimestamp(minute * 60) \
+                                       .strftime("%Y-%m-%d %H:%M")
+    return text
+
+
+def fileinfo(fs):
+    permission = fs.get("permission", "000")
+    return "%s%-10s  %-10s %-10s %8s %s %s" % (
+         'd' if fs.get("type", "FILE") == "DIRECTORY" else '-',
+         PERMISSIONS.get(permission) or getpermission(permission),
+         fs.get("owner", "<no user>"),
+         fs.get("group", "<no group>"),
+         fs.get("length", 0),
+         format_time(fs.get("modificationTime", 0)),
+         fs.get("pathSuffix", "<no name>"))
+
+
+# the fields of a listing and their default
+COLUMNS = (("type", "FILE"),
+           ("permission", "000"),
+           ("owner", "<no user>"),
+           ("group", "<no group>"),
+           ("length", 0),
+           ("modificationTime", 0),
+           ("pathSuffix", "<no name>"))
+
+SORT_KEYS = {"size": "length", "mtime": "modificationTime", "name": "pathSuffix"}
+
+
+def to_columns(statuses):
+    """ the FileStatus records as one list per field """
+    if hasattr(statuses, "columns"):
+        # FileStatuses are stored that way
+        return statuses.columns
+    return dict((name, [fs.get(name, default) for fs in statuses])
+                for name, default in COLUMNS)
+
+
+def format_columns(columns, type_=None, sort=None, reverse=False):
+    """ the ls lines of a listing in columns, of the directories only
+        (type_ 'd') or the files only ('f'), sorted by size, mtime or name
+    """
+    types = columns["type"]
+    rows = range(len(types))
+    if type_ is not None:
+        directory = "DIRECTORY" if type_ == "d" else "FILE"
+        rows = [i for i in rows if types[i] == directory]
+    if sort is not None:
+        rows = sorted(rows, key=columns[SORT_KEYS[sort]].__getitem__,
+                      reverse=reverse)
+    elif reverse:
+        rows = rows[::-1]
+
+    permissions = columns["permission"]
+    owners = columns["owner"]
+    groups = columns["group"]
+    lengths = columns["length"]
+    mtimes = columns["modificationTime"]
+    names = columns["pathSuffix"]
+    return ["%s%-10s  %-10s %-10s %8s %s %s" % (
+                "d" if types[i] == "DIRECTORY" else "-",
+                PERMISSIONS.get(permissions[i]) or
+                    getpermission(permissions[i]),
+                owners[i],
+                groups[i],
+                lengths[i],
+                format_time(mtimes[i]),
+                names[i])
+            for i in rows]
+
+
+def parse_size(size):
+    """ bytes of a size like 10, 10k, 1.5M or 2G """
+    units = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+    unit = units.get(size[-1:].lower())
+    if unit is None:
+        return float(size)
+    return float(size[:-1]) * unit
+
+
+def format_size(size):
+    """ a size in bytes, human readable """
+    for unit in ('', 'K', 'M', 'G', 'T'):
+        if size < 1024 or unit == 'T':
+            return ('%d%s' if unit == '' else '%.1f%s') % (size, unit)
+        size /= 1024.0
+
+
+class Progress(object):
+    """ throughput of a transfer, shown on a terminal while it runs """
+
+    def __init__(self, name, total=None, out=sys.stderr, interval=0.5,
+                 count=None):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.count = count  # files of a tree transfer
+        self.files = 0
+        self.out = out if out is not None and out.isatty() else None
+        self.interval = interval
+        self.start = self.shown = time.time()
+        self.__lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start
+
+    @property
+    def rate(self):
+        """ bytes per second """
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def file_rate(self):
+        """ files per second """
+        elapsed = self.elapsed
+        return self.files / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        total = "" if self.total is None else " / %.1f MB" % (self.total / MB)
+        files = "" if self.count is None else \
+                "%d / %d files, %.1f files/s, " % (
+                    self.files, self.count, self.file_rate)
+        return "%s: %s%.1f MB%s, %.1f MB/s" % (
+            self.name, files, self.done / MB, total, self.rate / MB)
+
+    def update(self, size, files=0):
+        with self.__lock:
+            self.done += size
+            self.files += files
+            if self.out is None or \
+                    time.time() - self.shown < self.interval:
+                return
+            self.shown = time.time()
+        self.out.write("\r%s" % self)
+        self.out.flush()
+
+    def finish(self):
+        if self.out is not None:
+            self.out.write("\r%s\n" % self)
+            self.out.flush()
+
+
+class ChunkedFile(object):
+    """ a local binary file read chunk_size bytes at a time
+
+        It is both iterable and file-like, so requests streams it as the
+        body with a Content-Length, and can rewind it on a redirect.
+    """
+
+    def __init__(self, filename, chunk_size, progress=None):
+        self.size = os.path.getsize(filename)
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.__file = open(filename, "rb")
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        chunk = self.__file.read(size)
+        if self.progress is not None:
+            self.progress.update(len(chunk))
+        return chunk
+
+    def tell(self):
+        return self.__file.tell()
+
+    def seek(self, offset, whence=0):
+        current = self.__file.tell()
+        position = self.__file.seek(offset, whence)
+        if self.progress is not None:
+            self.progress.update(position - current)
+        return position
+
+    def close(self):
+        self.__file.close()
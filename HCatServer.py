@@ -7,6 +7,8 @@ from RestServer import RestServer
 
 class HCatServer(RestServer):
     rootpath = "/templeton/v1"
+    cache_ttls = ((r"/ddl/database", 300),
+                  (r"/status", 0))
     def __init__(self, opts):
         super(HCatServer, self).__init__(opts)
         self.__db = "default"
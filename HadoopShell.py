@@ -11,6 +11,7 @@ from cmd import Cmd
 import json
 import os
 import sys
+import types
 
 from RestServer import RestServer
 
@@ -90,6 +91,20 @@ class HadoopShell(Cmd, object):
         HadoopCmd("proxy", "Get/Set the proxy", "[prefix url]"),
         HadoopCmd("passwd", "Set the password"),
         HadoopCmd("geturl", "Get the url", "<url>"),
+        HadoopCmd("pool", "Show the connection pool reuse counts"),
+        HadoopCmd("cache", "Show/Set the response cache",
+                  "[on|off|clear|ttl <pattern> <seconds>]"),
+        HadoopCmd("stats", "Show/Reset/Export the request latencies",
+                  "[reset|json [file]]"),
+        HadoopCmd("compress", "Show wire/decoded bytes, Set compression",
+                  "[on|off|body <min bytes>|body off]"),
+        HadoopCmd("limit", "Show/Set the requests/s and in-flight limits",
+                  ["[<rate|off>", "[max inflight|off]]"]),
+        HadoopCmd("cassette", "Record/Replay the requests to/from a file",
+                  ["[record <file>", "|replay <file> [realtime]|off]"]),
+        HadoopCmd("retry", "Show/Set the retries and the read hedging",
+                  ["[<retries> [backoff]", "|hedge <percentile|off>|off]"]),
+        HadoopCmd("breaker", "Show/Reset the circuit breakers", "[reset]"),
         HadoopCmd("quit", "Exit the program"),
         HadoopCmd("exit", "Exit the program"),
         Seperator(),
@@ -121,6 +136,9 @@ class HadoopShell(Cmd, object):
             print(json.dumps(data, indent=4))
         elif type(data).__name__ in ('list', 'tuple'):
             print_list(*data)
+        elif isinstance(data, types.GeneratorType):
+            for line in data:
+                print(line)
         else:
             if data is not None:
                 print(data)
@@ -196,6 +214,30 @@ class HadoopShell(Cmd, object):
     def do_geturl(self, data):
         self.do_echo(self.server.Get(data))
 
+    def do_pool(self, data):
+        self.do_echo(self.server.do_pool(data))
+
+    def do_cache(self, data):
+        self.do_echo(self.server.do_cache(data))
+
+    def do_stats(self, data):
+        self.do_echo(self.server.do_stats(data))
+
+    def do_compress(self, data):
+        self.do_echo(self.server.do_compress(data))
+
+    def do_limit(self, data):
+        self.do_echo(self.server.do_limit(data))
+
+    def do_cassette(self, data):
+        self.do_echo(self.server.do_cassette(data))
+
+    def do_retry(self, data):
+        self.do_echo(self.server.do_retry(data))
+
+    def do_breaker(self, data):
+        self.do_echo(self.server.do_breaker(data))
+
 
     def postcmd(self, stop, line):
        return stop
@@ -226,6 +268,39 @@ class HadoopShell(Cmd, object):
                           help="Port, [default: %default]")
         parser.add_option("-u", "--user", default=os.getenv("USER"),
                           help="User, [default: %default]")
+        parser.add_option("--pool-size", type=int, default=10,
+                          help="Number of host pools, [default: %default]")
+        parser.add_option("--pool-maxsize", type=int, default=10,
+                          help="Connections per host, [default: %default]")
+        parser.add_option("--pool-idle", type=float, default=60,
+                          help="Idle timeout in seconds, [default: %default]")
+        parser.add_option("--chunk-size", type=int, default=64 * 1024,
+                          help="Streaming chunk size, [default: %default]")
+        parser.add_option("--compress-threshold", type=int,
+                          help="Gzip request bodies of at least this size")
+        parser.add_option("--max-rate", type=float,
+                          help="Requests per second to the service")
+        parser.add_option("--max-inflight", type=int,
+                          help="Requests in flight to the service")
+        parser.add_option("--timeout", type=float,
+                          help="Connect/read timeout in seconds")
+        parser.add_option("--retries", type=int, default=3,
+                          help="Retries of idempotent requests, "
+                               "[default: %default]")
+        parser.add_option("--hedge", type=float,
+                          help="Hedge the reads slower than this percentile")
+        parser.add_option("--record", metavar="FILE",
+                          help="Record the requests to a cassette")
+        parser.add_option("--replay", metavar="FILE",
+                          help="Replay the requests from a cassette")
+        parser.add_option("--realtime", action="store_true", default=False,
+                          help="Replay with the recorded latencies")
+        parser.add_option("--cache", action="store_true", default=False,
+                          help="Cache the GET responses")
+        parser.add_option("--cache-ttl", type=float, default=60,
+                          help="Cache ttl in seconds, [default: %default]")
+        parser.add_option("--cache-size", type=int, default=16 * 1024 * 1024,
+                          help="Cache size in bytes, [default: %default]")
 
         return parser
 
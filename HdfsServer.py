@@ -1,16 +1,55 @@
 
 #exports
-__all__ = ('HdfsServer', )
+__all__ = ('HdfsServer',
+           'AsyncHdfsServer', )
 
+import asyncio
+import functools
+import json
 import os
+import re
+import requests
+import sys
+import threading
+import time
+import types
 
-from FileUtil import fileinfo
-from RestServer import RestServer, STATUS_OK, STATUS_CREATED
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fnmatch import fnmatch
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+from AsyncRestServer import AsyncRestServer
+from FileStatus import FileStatus, FileStatuses
+from FileUtil import ChunkedFile, Progress, MB, parse_size, format_size, \
+                     file_checksum, to_columns, format_columns, CRC32C_NATIVE
+from RestCache import StatusCache, STATUS_TTL, STATUS_SIZE
+from RestServer import RestServer, STATUS_OK, STATUS_CREATED, \
+                       make_url, print_curl, get_result
+
+GET_WORKERS = 1  # ranges downloaded at the same time by get
+RANGE_SIZE = 64 * 1024 * 1024  # bytes of a range
+LOCATION_TTL = 60  # seconds a DataNode location of an OPEN is reused
+TRANSFER_WORKERS = 8  # files transferred at the same time by put/get -r
+WALK_WORKERS = 16  # directories listed at the same time by a walk
+BULK_WORKERS = 16  # rm/chmod/chown/mkdir run at the same time
+DAY = 24 * 3600 * 1000  # in ms, like the modificationTime
+TAIL_LINES = 10  # lines shown by tail
+TAIL_BLOCK = 64 * 1024  # bytes read back from the end, doubled as needed
+TAIL_INTERVAL = 0.5  # seconds between the polls of a growing file
+TAIL_MAX_INTERVAL = 10.0  # seconds between the polls of an idle file
+
+SYNC_MANIFEST = '.hdfs-sync.json'  # kept at the top of a synced tree
+PART_SUFFIX = '.part'  # of a download until it completes
+
+# what an unknown op gets
+UNSUPPORTED = ('IllegalArgumentException', 'UnsupportedOperationException')
 
 
 def get_opstr(op):
     return {
         'ls': 'LISTSTATUS',
+        'lsbatch': 'LISTSTATUS_BATCH',
         'cat': 'OPEN',
         'mkdir': 'MKDIRS',
         'put': 'CREATE',
@@ -19,43 +58,258 @@ def get_opstr(op):
         'chmod': 'SETPERMISSION',
         'chown': 'SETOWNER',
         'rename': 'RENAME',
-        'stat': 'GETFILESTATUS'
+        'stat': 'GETFILESTATUS',
+        'checksum': 'GETFILECHECKSUM'
     }[op]
 
 
+def join(dirpath, name):
+    return dirpath.rstrip('/') + '/' + name
+
+
+def has_magic(name):
+    return any(c in name for c in '*?[')
+
+
+def get_flags(params, flags):
+    """ the leading flags of params found in flags, and the rest """
+    found = set()
+    while params and params[0] in flags:
+        found.add(params[0])
+        params = params[1:]
+    return found, params
+
+
+def failed(r):
+    """ whether a reply of a metadata operation is an error """
+    if r is None:
+        return True
+    if isinstance(r, dict):
+        return r.get('boolean') is False or 'status' in r or \
+               'RemoteException' in r
+    return False
+
+
+def get_location(resp):
+    """ the DataNode url of a redirect or of a noredirect=true reply """
+    if resp.is_redirect:
+        return resp.headers.get('Location')
+    if resp.status_code == STATUS_OK and \
+            resp.headers.get('Content-Type', '').startswith('application/json'):
+        try:
+            return resp.json().get('Location')
+        except (ValueError, AttributeError):
+            return None
+
+
+def set_query(url, params):
+    """ the url with its offset/length replaced by params """
+    uri = urlparse(url)
+    query = [(k, v) for k, v in parse_qsl(uri.query)
+             if k not in ('offset', 'length')]
+    query.extend((k, v) for k, v in params.items()
+                 if k in ('offset', 'length'))
+    return urlunparse(uri._replace(query=urlencode(query)))
+
 class HdfsServer(RestServer):
     rootpath = '/webhdfs/v1'
+    cache_ttls = ((r'op=OPEN', 0),
+                  (r'op=GETFILESTATUS', 0),  # StatusCache keeps them
+                  (r'op=LISTSTATUS', 10))
+    # a CREATE/APPEND body is stored as it comes, gzipped or not
+    compress_body = False
+    homes = {}  # (weburl, user) -> home directory
 
     def __init__(self, opts):
         super(HdfsServer, self).__init__(opts)
+        self.get_workers = getattr(opts, 'get_workers', GET_WORKERS)
+        self.range_size = getattr(opts, 'range_size', RANGE_SIZE)
+        self.transfer_workers = getattr(opts, 'transfer_workers',
+                                        TRANSFER_WORKERS)
+        self.walk_workers = getattr(opts, 'walk_workers', WALK_WORKERS)
+        self.bulk_workers = getattr(opts, 'bulk_workers', BULK_WORKERS)
+        self.tail_interval = getattr(opts, 'tail_interval',
+                                     TAIL_MAX_INTERVAL)
+        self.list_batch = True  # until the server turns out to lack it
+        self.redirect = True  # until the server turns out to answer itself
+        self.statuses = StatusCache(getattr(opts, 'status_ttl', STATUS_TTL),
+                                    getattr(opts, 'status_size', STATUS_SIZE))
+        # path -> {block index: (expiry, DataNode url)} of the OPENs
+        self.locations = {}
+        self.__locations_lock = threading.Lock()
 
-        self.__cwd = self.home
+        # resolved on first use, a new server makes no request
+        self.__cwd = None
 
     @property
     def weburl(self):
         return self.baseurl + self.rootpath
 
+    def get_home(self):
+        """ GETHOMEDIRECTORY of the user, None if it failed """
+        r = self.Get(self.weburl, 'home')
+        return r.get('Path') if isinstance(r, dict) else None
+
     @property
     def home(self):
-        r = self.Get(self.weburl, 'home')
-        return r['Path'] if r is not None else '/'
+        """ the home directory of the user, asked once per service/user """
+        key = (self.weburl, self.user)
+        home = HdfsServer.homes.get(key)
+        if home is None:
+            home = self.get_home()
+            if home is None:
+                return '/'
+            HdfsServer.homes[key] = home
+        return home
 
     @property
     def cwd(self):
+        if self.__cwd is None:
+            self.__cwd = self.home
         return self.__cwd
 
-    def Get(self, url, op, params=None, text=False):
+    def abspath(self, path):
+        if path[0] != '/':
+            path = f'{self.cwd}/{path}'
+        return path
+
+    def forget_location(self, path):
+        with self.__locations_lock:
+            self.locations.pop(self.abspath(path), None)
+
+    def two_step(self,
+                 method,
+                 url,
+                 params,
+                 data=None,
+                 text=False,
+                 expected=(STATUS_OK, ),
+                 stream=False,
+                 chunk_size=None,
+                 block_size=None,
+                 **kwargs):
+        """ CREATE/APPEND/OPEN: get the DataNode url from the NameNode,
+            then send the body to (or read the data from) the DataNode only
+
+            The DataNode urls of the OPENs are reused for LOCATION_TTL
+            seconds, by block of block_size bytes: each block has its own
+            DataNodes. A read at an offset of an unknown block_size asks the
+            NameNode every time. A server which does not redirect gets the
+            body directly.
+        """
+        path = url[len(self.weburl):]
+        if method != 'GET':
+            self.forget_location(path)
+
+        if not self.redirect:
+            direct_url = make_url(url, self.user, params)
+            if self.curl:
+                print_curl(method, direct_url, None, data)
+            resp = self.send(method, direct_url, proxies=self.proxies,
+                             data=data, stream=stream, **kwargs)
+            if resp is None:
+                return None
+            return get_result(resp, text, expected, stream,
+                              chunk_size or self.chunk_size)
+
+        location = block = None
+        if method == 'GET':
+            offset = int(params.get('offset', 0))
+            if offset == 0 or block_size:
+                block = offset // block_size if block_size else 0
+        if block is not None:
+            with self.__locations_lock:
+                expiry, location = self.locations.get(path, {}).get(
+                    block, (0, None))
+            if expiry < time.time():
+                location = None
+
+        for cached in ((True, False) if location else (False, )):
+            if not cached:
+                namenode_url = make_url(url, self.user,
+                                        dict(params, noredirect='true'))
+                if self.curl:
+                    print_curl(method, namenode_url)
+                resp = self.send(method, namenode_url,
+                                 proxies=self.proxies,
+                                 stream=True,
+                                 allow_redirects=False)
+                if resp is None:
+                    return None
+
+                location = get_location(resp)
+                if location is None:
+                    # no redirect, the server answered by itself and will
+                    # get the bodies directly from now on, unless it failed
+                    if resp.status_code in expected:
+                        self.redirect = False
+                    if method == 'GET' or resp.status_code not in expected:
+                        return get_result(resp, text, expected, stream,
+                                          chunk_size or self.chunk_size)
+                    # the empty file just created is replaced by the body
+                    location = make_url(url, self.user,
+                                        dict(params, overwrite='true')
+                                        if params['op'] == 'CREATE'
+                                        else params)
+                resp.close()
+
+            datanode_url = set_query(location, params)
+            if self.curl:
+                print_curl(method, datanode_url, None, data)
+            resp = self.send(method, datanode_url, proxies=self.proxies,
+                             data=data, stream=stream, **kwargs)
+            if cached and (resp is None or resp.status_code not in expected):
+                # the DataNode moved or the file changed, ask again
+                if resp is not None:
+                    resp.close()
+                self.forget_location(path)
+                continue
+
+            if block is not None and not cached and resp is not None and \
+                    resp.status_code in expected:
+                with self.__locations_lock:
+                    self.locations.setdefault(path, {})[block] = (
+                        time.time() + LOCATION_TTL, location)
+            break
+
+        if resp is None:
+            return None
+        return get_result(resp, text, expected, stream,
+                          chunk_size or self.chunk_size)
+
+    def Get(self, url, op, params=None, text=False, **kwargs):
         if params is None: params = {}
         params['op'] = get_opstr(op)
 
+        if op == 'cat':
+            return self.two_step('GET', url, params, text=text, **kwargs)
+
         return super(HdfsServer, self).Get(url,
                                         user=self.user,
                                         params=params,
-                                        text=text)
+                                        text=text,
+                                        **kwargs)
+
+    def changed(self, url, destination=None):
+        """ forget what is cached about the path of url, and about the
+            destination of a rename
+        """
+        for path in (url[len(self.weburl):], destination):
+            if path:
+                self.forget_location(path)
+                self.statuses.invalidate(self.abspath(path))
+                # the streamed NameNode step of a CREATE/APPEND goes past
+                # the response cache, and the DataNode has another url
+                if self.cache is not None:
+                    self.cache.invalidate(self.weburl + self.abspath(path))
 
-    def Delete(self, url):
+    def Delete(self, url, recursive=False):
         params = {'op': 'DELETE'}
-        return super(HdfsServer, self).Delete(url, user=self.user, params=params)
+        if recursive:
+            params['recursive'] = 'true'
+        r = super(HdfsServer, self).Delete(url, user=self.user, params=params)
+        self.changed(url)
+        return r
 
     def Put(self,
             url,
@@ -63,39 +317,337 @@ class HdfsServer(RestServer):
             params=None,
             data=None,
             text=False,
-            expected=(STATUS_OK, )):
+            expected=(STATUS_OK, ),
+            **kwargs):
 
         if params is None: params = {}
         params['op'] = get_opstr(op)
 
-        return super(HdfsServer, self).Put(url,
-                                        user=self.user,
-                                        params=params,
-                                        data=data,
-                                        text=text,
-                                        expected=expected)
+        if op == 'put':
+            r = self.two_step('PUT', url, params, data=data, text=text,
+                              expected=expected, **kwargs)
+        else:
+            r = super(HdfsServer, self).Put(url,
+                                            user=self.user,
+                                            params=params,
+                                            data=data,
+                                            text=text,
+                                            expected=expected,
+                                            **kwargs)
+        self.changed(url, params.get('destination'))
+        return r
 
-    def Post(self, url, op, params=None, data=None, text=False):
+    def Post(self, url, op, params=None, data=None, text=False, **kwargs):
         if params is None: params = {}
         params['op'] = get_opstr(op)
-        return super(HdfsServer, self).Post(
-            url, user=self.user, params=params, data=data, text=text)
 
+        if op == 'append':
+            r = self.two_step('POST', url, params, data=data, text=text,
+                              **kwargs)
+        else:
+            r = super(HdfsServer, self).Post(
+                url, user=self.user, params=params, data=data, text=text,
+                **kwargs)
+        self.changed(url)
+        return r
+
+
+    def stat(self, path, cached=True):
+        path = self.abspath(path).rstrip('/') or '/'
+        fs = self.statuses.get(path) if cached else None
+        if fs is not None:
+            return fs
 
-    def exist(self, path):
-        if path[0] != '/':
-            path = f'{self.cwd}/{path}'
         r = self.Get(self.weburl + path, 'stat')
         if r is None: return
-        return 'FileStatus' in r
+        fs = FileStatus.from_json(r.get('FileStatus'))
+        if fs is not None:
+            self.statuses.put(path, fs)
+        return fs
+
+    def exist(self, path):
+        return self.stat(path) is not None
 
     def is_dir(self, path):
-        if path[0] != '/':
-            path = f'{self.cwd}/{path}'
-        r = self.Get(self.weburl + path, 'stat')
- 
-        if r is None: return False
-        return r.get('FileStatus', {}).get('type', '') == 'DIRECTORY'
+        fs = self.stat(path)
+        return fs is not None and fs.get('type', '') == 'DIRECTORY'
+
+    def cache_status(self, dirpath, fs):
+        """ keep the status of an entry of a listing of dirpath """
+        if fs.get('pathSuffix'):
+            self.statuses.put(join(self.abspath(dirpath), fs['pathSuffix']),
+                              fs)
+
+    def list_pages(self, path):
+        """ the FileStatus lists of the entries of path, one per
+            LISTSTATUS_BATCH page. Raises FileNotFoundError if path does
+            not exist.
+        """
+        url = self.weburl + self.abspath(path)
+        start_after = None
+        while self.list_batch:
+            params = {} if start_after is None \
+                        else {'startAfter': start_after}
+            r = self.Get(url, 'lsbatch', params=params)
+            if r is None: return
+
+            listing = r.get('DirectoryListing')
+            if listing is None:
+                exception = r.get('RemoteException', {}).get('exception')
+                if start_after is None and exception in UNSUPPORTED:
+                    # no LISTSTATUS_BATCH before Hadoop 2.8
+                    self.list_batch = False
+                    break
+                raise FileNotFoundError(path)
+
+            page = listing['partialListing']['FileStatuses']['FileStatus']
+            statuses = [FileStatus.from_json(fs) for fs in page]
+            for fs in statuses:
+                self.cache_status(path, fs)
+            yield statuses
+            if not listing.get('remainingEntries') or not statuses:
+                return
+            start_after = statuses[-1]['pathSuffix']
+
+        r = self.Get(url, 'ls')
+        if r is None: return
+        if not r.get('FileStatuses'):
+            raise FileNotFoundError(path)
+        statuses = [FileStatus.from_json(fs)
+                    for fs in r['FileStatuses']['FileStatus']]
+        for fs in statuses:
+            self.cache_status(path, fs)
+        yield statuses
+
+    def list_status(self, path):
+        """ the FileStatus of the entries of path, a page at a time """
+        for statuses in self.list_pages(path):
+            for fs in statuses:
+                yield fs
+
+    def ls(self, path, compact=False):
+        """ the FileStatus list of the entries of path, FileStatuses when
+            compact, None if path does not exist
+        """
+        try:
+            if compact:
+                return FileStatuses(self.list_status(path))
+            return list(self.list_status(path))
+        except FileNotFoundError:
+            return None
+
+    def walk(self, path, workers=None, compact=False):
+        """ (dirpath, dirs, files) of the tree under path like os.walk,
+            dirs and files being FileStatus lists, or FileStatuses when
+            compact
+
+            The directories are listed breadth first, workers of them at
+            the same time, and come in the order their listing completes.
+        """
+        workers = workers or self.walk_workers
+        pending = deque([self.abspath(path).rstrip('/') or '/'])
+        running = {}
+        executor = ThreadPoolExecutor(workers)
+        try:
+            while pending or running:
+                # a bounded number of listings queued ahead
+                while pending and len(running) < 2 * workers:
+                    dirpath = pending.popleft()
+                    running[executor.submit(self.ls, dirpath)] = dirpath
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dirpath = running.pop(future)
+                    statuses = future.result() or []
+                    dirs = [fs for fs in statuses
+                            if fs.get('type') == 'DIRECTORY']
+                    files = [fs for fs in statuses
+                             if fs.get('type') != 'DIRECTORY']
+                    pending.extend(join(dirpath, fs['pathSuffix'])
+                                   for fs in dirs)
+                    if compact:
+                        dirs, files = FileStatuses(dirs), FileStatuses(files)
+                    yield dirpath, dirs, files
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def transfer(self, func, *args):
+        """ func(*args) until it returns True, up to the retries """
+        retry = self.retry  # None once retry is off
+        for attempt in range(1 + (retry.retries if retry else 0)):
+            if attempt > 0:
+                time.sleep(retry.delay(attempt - 1))
+            if func(*args):
+                return True
+        return False
+
+    def put_file(self, localfile, remotefile, progress):
+        """ upload localfile, True when done """
+        with ChunkedFile(localfile, self.chunk_size, progress) as f:
+            try:
+                r = self.Put(self.weburl + remotefile,
+                             'put',
+                             params={'overwrite': 'true'},
+                             data=f,
+                             text=True,
+                             expected=(STATUS_CREATED, ))
+            except (requests.exceptions.RequestException, OSError):
+                r = None
+            if r is None or isinstance(r, dict):
+                progress.update(-f.tell())
+                return False
+        progress.update(0, files=1)
+        return True
+
+    def get_file(self, remotefile, localfile, progress, offset=0):
+        """ download remotefile from offset to the end, True when done """
+        done = 0
+        try:
+            r = self.Get(self.weburl + remotefile, 'cat',
+                         params={'offset': offset}, stream=True)
+            if not isinstance(r, types.GeneratorType):
+                return False
+            with open(localfile, 'ab' if offset else 'wb') as fd:
+                for chunk in r:
+                    fd.write(chunk)
+                    done += len(chunk)
+                    progress.update(len(chunk))
+        except (requests.exceptions.RequestException, OSError):
+            progress.update(-done)
+            return False
+        progress.update(0, files=1)
+        return True
+
+    def copy_file(self, srcfile, destfile, progress, fresh=False):
+        """ pipe the OPEN stream of srcfile into the CREATE of destfile,
+            chunk_size bytes at a time. True when done.
+
+            fresh tells destfile did not exist before, only then a partial
+            copy left by a broken transfer is deleted. A refused CREATE
+            (FileAlreadyExists) never is.
+        """
+        started = False
+        done = 0
+
+        def body(chunks):
+            nonlocal started, done
+            started = True
+            for chunk in chunks:
+                done += len(chunk)
+                progress.update(len(chunk))
+                yield chunk
+
+        chunks = None
+        try:
+            chunks = self.Get(self.weburl + srcfile, 'cat', stream=True)
+            if not isinstance(chunks, types.GeneratorType):
+                return False
+            r = self.Put(self.weburl + destfile,
+                         'put',
+                         params={'overwrite': 'false'},
+                         data=body(chunks),
+                         text=True,
+                         expected=(STATUS_CREATED, ))
+        except (requests.exceptions.RequestException, OSError):
+            r = None
+        finally:
+            if isinstance(chunks, types.GeneratorType):
+                chunks.close()
+
+        if r is None or isinstance(r, dict):
+            progress.update(-done)
+            if started and fresh and r is None:
+                # do not leave a partial copy behind
+                self.Delete(self.weburl + destfile)
+            return False
+        progress.update(0, files=1)
+        return True
+
+    def tree_result(self, progress, failed):
+        if progress.count:
+            progress.finish()
+        result = '%d files, %.1f MB in %.1fs, %.1f files/s, %.1f MB/s' % (
+            progress.files, progress.done / MB, progress.elapsed,
+            progress.file_rate, progress.rate / MB)
+        if failed:
+            result += '\nFailed:\n' + '\n'.join(failed)
+        return result
+
+    def put_tree(self, localdir, remotedir):
+        """ upload the local tree on transfer_workers connections """
+        dirs, files = [], []
+        for dirpath, dirnames, filenames in os.walk(localdir):
+            relpath = os.path.relpath(dirpath, localdir)
+            target = remotedir if relpath == '.' else \
+                     join(remotedir, relpath.replace(os.sep, '/'))
+            if not dirnames:
+                # MKDIRS creates the parents, the leaves are enough
+                dirs.append(target)
+            files.extend((os.path.join(dirpath, name), join(target, name))
+                         for name in filenames)
+
+        progress = Progress(localdir,
+                            sum(os.path.getsize(f) for f, _ in files),
+                            count=len(files))
+        with ThreadPoolExecutor(self.transfer_workers) as executor:
+            list(executor.map(
+                lambda d: self.Put(self.weburl + d, 'mkdir'), dirs))
+            results = list(executor.map(
+                lambda f: self.transfer(self.put_file, f[0], f[1], progress),
+                files))
+
+        return self.tree_result(
+            progress, [f for (f, _), ok in zip(files, results) if not ok])
+
+    def copy_tree(self, srcdir, destdir):
+        """ copy the remote tree on transfer_workers connections """
+        # into a new tree, the partial copies of broken transfers are ours
+        fresh = self.stat(destdir, cached=False) is None
+        dirs, files = [], []
+        for dirpath, subdirs, statuses in self.walk(srcdir):
+            target = destdir + dirpath[len(srcdir):]
+            if not subdirs:
+                dirs.append(target)
+            files.extend((join(dirpath, fs['pathSuffix']),
+                          join(target, fs['pathSuffix']),
+                          fs.get('length', 0))
+                         for fs in statuses)
+
+        progress = Progress(srcdir, sum(f[2] for f in files),
+                            count=len(files))
+        with ThreadPoolExecutor(self.transfer_workers) as executor:
+            list(executor.map(
+                lambda d: self.Put(self.weburl + d, 'mkdir'), dirs))
+            results = list(executor.map(
+                lambda f: self.transfer(self.copy_file, f[0], f[1], progress,
+                                        fresh),
+                files))
+
+        return self.tree_result(
+            progress, [f for (f, _, _), ok in zip(files, results) if not ok])
+
+    def get_tree(self, remotedir, localdir):
+        """ download the remote tree on transfer_workers connections """
+        remotedir = self.abspath(remotedir).rstrip('/') or '/'
+        files = []
+        for dirpath, _, statuses in self.walk(remotedir):
+            relpath = dirpath[len(remotedir):].lstrip('/')
+            target = os.path.join(localdir, *relpath.split('/'))
+            os.makedirs(target, exist_ok=True)
+            files.extend((join(dirpath, fs['pathSuffix']),
+                          os.path.join(target, fs['pathSuffix']),
+                          fs.get('length', 0))
+                         for fs in statuses)
+
+        progress = Progress(remotedir, sum(f[2] for f in files),
+                            count=len(files))
+        with ThreadPoolExecutor(self.transfer_workers) as executor:
+            results = list(executor.map(
+                lambda f: self.transfer(self.get_file, f[0], f[1], progress),
+                files))
+
+        return self.tree_result(
+            progress, [f for (f, _, _), ok in zip(files, results) if not ok])
 
 #-- operations
     def do_lls(self, data=''):
@@ -115,43 +667,364 @@ class HdfsServer(RestServer):
         else:
             self.__cwd = self.home
 
-    def do_ls(self, filename, filter_=lambda _: True):
-        if len(filename) == 0:
-            filename = self.cwd
+    def do_ls(self, data, type_=None):
+        flags, params = get_flags(data.split(), ('-S', '-t', '-N', '-r'))
+        if len(params) > 1:
+            yield 'Incorrect parameters'
+            return
+        filename = self.abspath(params[0]) if params else self.cwd
 
-        if filename[0] != '/':
-            filename = f'{self.cwd}/{filename}'
+        sort = '-S' in flags and 'size' or '-t' in flags and 'mtime' or \
+               '-N' in flags and 'name' or None
+        reverse = '-r' in flags
+        try:
+            if sort is None and not reverse:
+                # printed page by page
+                for statuses in self.list_pages(filename):
+                    for line in format_columns(to_columns(statuses), type_):
+                        yield line
+            else:
+                statuses = FileStatuses()
+                for page in self.list_pages(filename):
+                    statuses.extend(page)
+                for line in format_columns(to_columns(statuses), type_,
+                                           sort, reverse):
+                    yield line
+        except FileNotFoundError:
+            yield 'File not found'
+
+    def do_dir(self, data):
+        return self.do_ls(data, 'd')
+
+    def find(self, path, name=None, type_=None, size=None, mtime=None):
+        """ the path and FileStatus of the entries under path matching all
+            the given predicates
+
+            name is a glob, type_ 'f' or 'd', size a number of bytes and
+            mtime a number of days, both meaning more than with a '+' and
+            less than with a '-' prefix. Like find(1), the age is counted
+            in whole days: -mtime 0 is less than a day ago.
+        """
+        def compare(spec, value, unit, parse):
+            if unit > 1:
+                value = value // unit * unit
+            if spec[0] == '+':
+                return value > parse(spec[1:]) * unit
+            if spec[0] == '-':
+                return value < parse(spec[1:]) * unit
+            return value == parse(spec) * unit
+
+        now = time.time() * 1000
+        predicates = []
+        if name is not None:
+            predicates.append(lambda fs: fnmatch(fs['pathSuffix'], name))
+        if type_ is not None:
+            directory = type_ == 'd'
+            predicates.append(
+                lambda fs: (fs.get('type') == 'DIRECTORY') == directory)
+        if size is not None:
+            predicates.append(
+                lambda fs: compare(size, fs.get('length', 0), 1, parse_size))
+        if mtime is not None:
+            predicates.append(
+                lambda fs: compare(mtime, now - fs.get('modificationTime', 0),
+                                   DAY, float))
+
+        for dirpath, dirs, files in self.walk(path):
+            for fs in dirs + files:
+                if all(predicate(fs) for predicate in predicates):
+                    yield join(dirpath, fs['pathSuffix']), fs
+
+    def du(self, path):
+        """ {directory: (bytes, files)} of the tree under path, the sizes
+            of the subdirectories rolled up into their parents
+        """
+        root = self.abspath(path).rstrip('/') or '/'
+        usage = {}
+        for dirpath, _, files in self.walk(root, compact=True):
+            usage[dirpath] = [files.total_length(), len(files)]
+
+        # deepest first, so that every directory is complete when added
+        for dirpath in sorted(usage, key=lambda d: d.count('/'),
+                              reverse=True):
+            if dirpath != root:
+                parent = dirpath.rpartition('/')[0] or '/'
+                if parent in usage:
+                    usage[parent][0] += usage[dirpath][0]
+                    usage[parent][1] += usage[dirpath][1]
+        return dict((d, tuple(u)) for d, u in usage.items())
+
+    def glob(self, pattern):
+        """ the paths matching a shell pattern, its components with
+            wildcards matched against the listings of their directories
+        """
+        paths = ['/']
+        for part in self.abspath(pattern).strip('/').split('/'):
+            if not part:
+                continue
+            if not has_magic(part):
+                paths = [join(path, part) for path in paths]
+                continue
+
+            with ThreadPoolExecutor(self.walk_workers) as executor:
+                listings = list(executor.map(self.ls, paths))
+            paths = [join(path, fs['pathSuffix'])
+                     for path, statuses in zip(paths, listings)
+                     for fs in statuses or ()
+                     if fs.get('pathSuffix') and
+                        fnmatch(fs['pathSuffix'], part)]
+        return sorted(paths)
+
+    def expand(self, patterns, recursive=False, create=False):
+        """ the paths of all the patterns, with everything under the
+            directories when recursive. A pattern matching nothing is
+            dropped, unless it is the name of a path to create.
+        """
+        paths = []
+        for pattern in patterns:
+            # a path with a [ in its name is taken as is when it matches
+            # nothing, or can be escaped as [[]
+            matches = self.glob(pattern)
+            if not matches and (create or self.exist(pattern)):
+                matches = [self.abspath(pattern)]
+            paths.extend(matches)
+        if recursive:
+            for path in list(paths):
+                if self.is_dir(path):
+                    for dirpath, dirs, files in self.walk(path):
+                        paths.extend(join(dirpath, fs['pathSuffix'])
+                                     for fs in dirs + files)
+        return paths
+
+    def bulk(self, func, paths, dry_run=False):
+        """ func(path) for all the paths on bulk_workers threads, returning
+            a summary and the errors
+        """
+        if dry_run:
+            return '%d paths would be changed' % len(paths)
+        if not paths:
+            return 'No match'
+
+        start = time.time()
+        with ThreadPoolExecutor(self.bulk_workers) as executor:
+            results = list(executor.map(func, paths))
+        elapsed = time.time() - start
+
+        errors = ['%s: %s' % (path, r) for path, r in zip(paths, results)
+                  if failed(r)]
+        result = '%d done, %d failed in %.1fs, %.1f ops/s' % (
+            len(paths) - len(errors), len(errors), elapsed,
+            len(paths) / elapsed if elapsed > 0 else 0.0)
+        if errors:
+            result += '\n' + '\n'.join(errors)
+        return result
 
-        r = self.Get(self.weburl + filename, 'ls')
+    def checksum(self, path):
+        """ the FileChecksum of a remote file """
+        r = self.Get(self.weburl + self.abspath(path), 'checksum')
+        if not isinstance(r, dict): return
+        return r.get('FileChecksum')
 
-        if r is not None:
-            if r.get('FileStatuses'):
-                fs_list = r['FileStatuses']['FileStatus']
-                return '\n'.join(
-                    filter(filter_, (fileinfo(fs) for fs in fs_list)))
+    def same_checksum(self, localfile, remotefile, fs):
+        """ whether the local file has the checksum of the remote one """
+        remote = self.checksum(remotefile)
+        match = re.match(r'MD5-of-\d+MD5-of-(\d+)(CRC32C?)$',
+                         (remote or {}).get('algorithm', ''))
+        if match is None:
+            # composite crcs or no checksum at all
+            return False
+        local = file_checksum(localfile, fs['blockSize'],
+                              int(match.group(1)), match.group(2))
+        return local['bytes'] == remote['bytes']
+
+    def sync(self, localdir, remotedir, checksum=False, dry_run=False):
+        """ upload the files of localdir which are not the same in
+            remotedir, on transfer_workers connections
+
+            A file of the same size is the same if it is newer in hdfs, or
+            with checksum if both have the same checksum. What was found
+            the same is kept in a manifest, so the next sync of unchanged
+            files needs no checksum.
+        """
+        remotedir = self.abspath(remotedir).rstrip('/') or '/'
+        manifest_file = os.path.join(localdir, SYNC_MANIFEST)
+        try:
+            with open(manifest_file) as f:
+                manifests = json.load(f)
+        except (OSError, ValueError):
+            manifests = {}
+        key = self.weburl + remotedir
+        manifest = manifests.get(key, {})
+
+        remote = {}
+        if self.is_dir(remotedir):
+            for dirpath, _, statuses in self.walk(remotedir):
+                relpath = dirpath[len(remotedir):].lstrip('/')
+                for fs in statuses:
+                    remote[relpath + '/' + fs['pathSuffix']
+                           if relpath else fs['pathSuffix']] = fs
+
+        local = {}
+        for dirpath, _, filenames in os.walk(localdir):
+            relpath = os.path.relpath(dirpath, localdir).replace(os.sep, '/')
+            for name in filenames:
+                if relpath == '.' and name == SYNC_MANIFEST:
+                    continue
+                st = os.stat(os.path.join(dirpath, name))
+                local[name if relpath == '.' else relpath + '/' + name] = \
+                    (st.st_size, int(st.st_mtime * 1000))
+
+        def state(relpath):
+            fs = remote[relpath]
+            return list(local[relpath]) + [fs['length'],
+                                           fs['modificationTime']]
+
+        send, check, same = [], [], []
+        for relpath, (size, mtime) in sorted(local.items()):
+            fs = remote.get(relpath)
+            if fs is None or fs.get('type') != 'FILE' or \
+                    fs.get('length') != size:
+                send.append(relpath)
+            elif manifest.get(relpath) == state(relpath):
+                same.append(relpath)
+            elif checksum:
+                check.append(relpath)
+            elif fs.get('modificationTime', 0) >= mtime:
+                same.append(relpath)
             else:
-                return 'File not found'
+                send.append(relpath)
 
-    def do_dir(self, filename):
-        return self.do_ls(filename, lambda f: f[0] == 'd')
+        if dry_run:
+            return '%d files to send, %d to check, %d unchanged' % (
+                len(send), len(check), len(same))
 
-    def do_mkdir(self, data):
-        params = data.split()
-        if len(params) < 1:
+        if check and not CRC32C_NATIVE:
+            print('checking %s with the python CRC32C, pip install crc32c '
+                  'for a faster one' % format_size(
+                      sum(local[r][0] for r in check)), file=sys.stderr)
+
+        localpath = lambda relpath: os.path.join(localdir,
+                                                 *relpath.split('/'))
+        remotepath = lambda relpath: join(remotedir, relpath)
+
+        with ThreadPoolExecutor(self.transfer_workers) as executor:
+            results = executor.map(
+                lambda r: self.same_checksum(localpath(r), remotepath(r),
+                                             remote[r]),
+                check)
+            for relpath, ok in zip(check, results):
+                (same if ok else send).append(relpath)
+
+            progress = Progress(localdir,
+                                sum(local[r][0] for r in send),
+                                count=len(send))
+            results = list(executor.map(
+                lambda r: self.transfer(self.put_file, localpath(r),
+                                        remotepath(r), progress),
+                send))
+
+        manifest = dict((r, state(r)) for r in same)
+        failed = []
+        for relpath, ok in zip(send, results):
+            fs = self.stat(remotepath(relpath)) if ok else None
+            if fs is None:
+                failed.append(localpath(relpath))
+            else:
+                remote[relpath] = fs
+                manifest[relpath] = state(relpath)
+
+        manifests[key] = manifest
+        with open(manifest_file + '.tmp', 'w') as f:
+            json.dump(manifests, f)
+        os.replace(manifest_file + '.tmp', manifest_file)
+
+        return '%d unchanged, %d checked\n%s' % (
+            len(same), len(check), self.tree_result(progress, failed))
+
+    def do_sync(self, data):
+        flags, params = get_flags(data.split(), ('-c', '-n'))
+        if len(params) == 1:
+            localdir = params[0]
+            remotedir = os.path.basename(os.path.abspath(localdir))
+        elif len(params) == 2:
+            localdir, remotedir = params
+        else:
             return 'Incorrect parameters'
+        if not os.path.isdir(localdir):
+            return 'Not a directory: %s' % localdir
+
+        return self.sync(localdir, remotedir, '-c' in flags, '-n' in flags)
+
+    def do_find(self, data):
+        params = data.split()
+        if not params or params[0].startswith('-'):
+            path = self.cwd
+        else:
+            path, params = params[0], params[1:]
+
+        options = {'-name': 'name', '-type': 'type_',
+                   '-size': 'size', '-mtime': 'mtime'}
+        predicates = {}
+        while params:
+            if len(params) < 2 or params[0] not in options:
+                yield 'Incorrect parameters'
+                return
+            predicates[options[params[0]]] = params[1]
+            params = params[2:]
+
+        if not self.is_dir(path):
+            yield 'File not found'
             return
 
-        dirname = params[0]
-        if dirname[0] != '/':
-            dirname = f'{self.cwd}/{dirname}'
+        for filepath, _ in self.find(path, **predicates):
+            yield filepath
+
+    def do_du(self, data):
+        params = data.split()
+        summary = '-s' in params
+        human = '-h' in params
+        params = [p for p in params if p not in ('-s', '-h')]
+        if len(params) > 1:
+            return 'Incorrect parameters'
+
+        path = self.abspath(params[0]) if params else self.cwd
+        path = path.rstrip('/') or '/'
+        if not self.is_dir(path):
+            return 'File not found'
+
+        usage = self.du(path)
+        show = format_size if human else str
+        return '\n'.join('%10s %8d  %s' % (show(usage[d][0]), usage[d][1], d)
+                         for d in sorted(usage)
+                         if not summary or d == path)
+
+    def do_mkdir(self, data):
+        params = data.split()
+        dry_run, perm = False, '777'
+        while params and params[0] in ('-n', '-m'):
+            if params[0] == '-n':
+                dry_run = True
+                params = params[1:]
+            elif len(params) > 1 and params[1].isdigit():
+                perm = params[1]
+                params = params[2:]
+            else:
+                return 'Incorrect parameters'
+        # a number is the permission of the former "mkdir <dir> <perm>",
+        # ./<number> makes a directory of that name
+        if len(params) < 1 or any(p.isdigit() for p in params):
+            return 'Incorrect parameters'
 
-        perm = params[1] if len(params) > 1 else '777'
-        return self.Put(self.weburl + dirname,
-                        'mkdir',
-                        params={'permission': perm})
+        return self.bulk(
+            lambda d: self.Put(self.weburl + d, 'mkdir',
+                               params={'permission': perm}),
+            self.expand(params, create=True), dry_run)
 
     def do_put(self, data):
         params = data.split()
+        if params and params[0] == '-r':
+            return self.put_r(params[1:])
+
         if len(params) == 1:
             localfile = params[0]
             remotefile = os.path.basename(localfile)
@@ -164,18 +1037,34 @@ class HdfsServer(RestServer):
             remotefile = f'{self.cwd}/{remotefile}'
         if self.is_dir(remotefile):
             remotefile = remotefile + '/' + os.path.basename(localfile)
-        with open(localfile) as f:
-            r = self.Put(self.weburl + remotefile,
-                         'put',
-                         params={'overwrite': 'true'},
-                         data=f.read(),
-                         text=True,
-                         expected=(STATUS_CREATED, ))
 
-            return {'status': 'OK'} if r is not None else 'Failed'
+        progress = Progress(localfile, os.path.getsize(localfile))
+        ok = self.put_file(localfile, remotefile, progress)
+        progress.finish()
+
+        return {'status': 'OK'} if ok else 'Failed'
+
+    def put_r(self, params):
+        if len(params) == 1:
+            localdir = params[0]
+            remotedir = os.path.basename(os.path.abspath(localdir))
+        elif len(params) == 2:
+            localdir, remotedir = params
+        else:
+            return 'Incorrect parameters'
+        if not os.path.isdir(localdir):
+            return 'Not a directory: %s' % localdir
+
+        remotedir = self.abspath(remotedir)
+        if self.is_dir(remotedir):
+            remotedir = join(remotedir,
+                             os.path.basename(os.path.abspath(localdir)))
+        return self.put_tree(localdir, remotedir)
 
     def do_cp(self, data):
         params = data.split()
+        if params and params[0] == '-r':
+            return self.cp_r(params[1:])
         if len(params) != 2:
             return 'Incorrect parameters'
 
@@ -188,16 +1077,32 @@ class HdfsServer(RestServer):
         if srcfile == destfile:
             return 'Cannot copy a file to itself'
 
-        if self.is_dir(destfile):
-            destfile = destfile + '/' + os.path.basename(srcfile)
-        if self.exist(destfile):
+        # the NameNode redirects a CREATE without looking at the path, an
+        # existing destination is refused only once the body is sent
+        fs = self.stat(destfile, cached=False)
+        if fs is not None and fs.get('type') == 'DIRECTORY':
+            destfile = join(destfile, os.path.basename(srcfile))
+            fs = self.stat(destfile, cached=False)
+        if fs is not None:
             return 'file %s already exist, cannot overwrite' % destfile
 
-        r = self.Put(self.weburl + destfile,
-                     'put',
-                     data=self.Get(self.weburl + srcfile, 'cat', text=True),
-                     text=True,
-                     expected=(STATUS_CREATED, ))
+        if self.copy_file(srcfile, destfile, Progress(srcfile), fresh=True):
+            return {'status': 'OK'}
+        return 'Failed'
+
+    def cp_r(self, params):
+        if len(params) != 2:
+            return 'Incorrect parameters'
+
+        srcdir, destdir = (self.abspath(p).rstrip('/') or '/' for p in params)
+        if not self.is_dir(srcdir):
+            return 'Not a directory: %s' % srcdir
+        if self.is_dir(destdir):
+            destdir = join(destdir, os.path.basename(srcdir))
+        if destdir == srcdir or destdir.startswith(srcdir + '/'):
+            return 'Cannot copy a directory into itself'
+
+        return self.copy_tree(srcdir, destdir)
 
     def do_append(self, data):
         params = data.split()
@@ -208,31 +1113,219 @@ class HdfsServer(RestServer):
         localfile, remotefile = params
         if remotefile[0] != '/':
             remotefile = f'{self.cwd}/{remotefile}'
-        with open(localfile) as f:
+        progress = Progress(localfile, os.path.getsize(localfile))
+        with ChunkedFile(localfile, self.chunk_size, progress) as f:
             r = self.Post(
-                self.weburl + remotefile, 'append', data=f.read(), text=True)
-
-            return {'status': 'OK'} if r is not None else 'Failed'
+                self.weburl + remotefile, 'append', data=f, text=True)
+        progress.finish()
 
-    def do_rm(self, filename):
-        if filename:
-            if filename[0] != '/':
-                filename = f'{self.cwd}/{filename}'
+        return {'status': 'OK'} if r is not None else 'Failed'
 
-            return self.Delete(self.weburl + filename)
-        else:
+    def do_rm(self, data):
+        flags, params = get_flags(data.split(), ('-n', '-r'))
+        if not params:
             return 'Missing filename'
 
+        return self.bulk(
+            lambda f: self.Delete(self.weburl + f, '-r' in flags),
+            self.expand(params), '-n' in flags)
+
     def do_cat(self, filename):
         if filename:
             if filename[0] != '/':
                 filename = f'{self.cwd}/{filename}'
-            return self.Get(self.weburl + filename, 'cat', text=True)
+            return self.Get(self.weburl + filename, 'cat', text=True,
+                            stream=True)
         else:
             return 'Missing filename'
 
+    def read(self, path, offset, length, block_size=None):
+        """ length bytes of a remote file from offset, None on error """
+        r = self.Get(self.weburl + path, 'cat',
+                     params={'offset': offset, 'length': length},
+                     stream=True, block_size=block_size)
+        if not isinstance(r, types.GeneratorType):
+            return None
+        try:
+            return b''.join(r)
+        except requests.exceptions.RequestException:
+            return None
+
+    def last_lines(self, path, length, count):
+        """ the last count complete lines of the first length bytes of a
+            remote file and what follows the last newline, read from the
+            end by blocks
+        """
+        if length == 0:
+            return [], b''
+
+        block = TAIL_BLOCK
+        while True:
+            offset = max(0, length - block)
+            data = self.read(path, offset, length - offset)
+            if data is None:
+                return None
+
+            lines = data.split(b'\n')
+            partial = lines.pop()
+            # the first line is complete only at the start of the file
+            if offset == 0 or len(lines) > count:
+                return (lines[-count:] if count else []), partial
+            block *= 2
+
+    def follow(self, path, offset, partial=b'', polls=None):
+        """ the lines appended to a remote file after offset, as they come,
+            partial being the start of the line offset is in
+
+            The length of the file is polled, every TAIL_INTERVAL seconds
+            while it grows, twice less often each time it does not, up to
+            tail_interval. Only the new bytes are read. polls is the number
+            of polls, None to follow until interrupted.
+        """
+        delay = min(TAIL_INTERVAL, self.tail_interval)
+        poll = 0
+        while polls is None or poll < polls:
+            poll += 1
+            time.sleep(delay)
+            fs = self.stat(path, cached=False)
+            if fs is None:
+                yield 'File not found'
+                return
+
+            length = fs.get('length', 0)
+            if length < offset:
+                yield 'File truncated'
+                offset, partial = 0, b''
+            if length == offset:
+                delay = min(delay * 2, self.tail_interval)
+                continue
+
+            data = self.read(path, offset, length - offset,
+                             fs.get('blockSize'))
+            if data is None:
+                continue
+            offset += len(data)
+            lines = (partial + data).split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                yield line.decode('utf-8', 'replace')
+            delay = min(TAIL_INTERVAL, self.tail_interval)
+
+    def do_tail(self, data):
+        params = data.split()
+        count, follow = TAIL_LINES, False
+        while params and params[0] in ('-n', '-f'):
+            if params[0] == '-f':
+                follow = True
+                params = params[1:]
+            elif len(params) > 1 and params[1].isdigit():
+                count = int(params[1])
+                params = params[2:]
+            else:
+                yield 'Incorrect parameters'
+                return
+        if len(params) != 1:
+            yield 'Incorrect parameters'
+            return
+
+        path = self.abspath(params[0])
+        fs = self.stat(path, cached=False)
+        if fs is None or fs.get('type') != 'FILE':
+            yield 'File not found'
+            return
+
+        length = fs.get('length', 0)
+        r = self.last_lines(path, length, count)
+        if r is None:
+            yield 'Failed'
+            return
+        lines, partial = r
+        if partial and not follow and count:
+            # a last line without a newline yet, shown as it is
+            lines = (lines + [partial])[-count:]
+        for line in lines:
+            yield line.decode('utf-8', 'replace')
+
+        if follow:
+            # the last line without a newline comes out once complete
+            for line in self.follow(path, length, partial):
+                yield line
+
+    def get_range(self, url, fd, offset, length, progress, block_size=None):
+        """ OPEN length bytes at offset and write them at the same offset
+            of the local file
+        """
+        done = 0
+        try:
+            r = self.Get(url, 'cat',
+                         params={'offset': offset, 'length': length},
+                         stream=True, block_size=block_size)
+            if not isinstance(r, types.GeneratorType):
+                return False
+            for chunk in r:
+                os.pwrite(fd, chunk, offset + done)
+                done += len(chunk)
+                progress.update(len(chunk))
+        except (requests.exceptions.RequestException, OSError):
+            pass
+
+        if done != length:
+            progress.update(-done)
+            return False
+        return True
+
+    def get_ranges(self, remotefile, localfile, length, workers,
+                   block_size=None):
+        """ download the file by ranges on workers connections, each range
+            is retried on its own. Returns the ranges which failed.
+        """
+        url = self.weburl + remotefile
+        ranges = [(offset, min(self.range_size, length - offset))
+                  for offset in range(0, length, self.range_size)]
+
+        progress = Progress(localfile, length)
+        fd = os.open(localfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, length)
+            else:
+                os.ftruncate(fd, length)
+
+            retry = self.retry  # None once retry is off
+            with ThreadPoolExecutor(workers) as executor:
+                for attempt in range(1 + (retry.retries if retry else 0)):
+                    if attempt > 0:
+                        time.sleep(retry.delay(attempt - 1))
+                    results = executor.map(
+                        lambda r: self.get_range(url, fd, r[0], r[1],
+                                                 progress, block_size),
+                        ranges)
+                    ranges = [r for r, ok in zip(ranges, results) if not ok]
+                    if not ranges:
+                        break
+
+            # keep only the part downloaded without a hole, so that a
+            # next get resumes from there
+            if ranges:
+                os.ftruncate(fd, ranges[0][0])
+        finally:
+            os.close(fd)
+        progress.finish()
+
+        return ranges
+
     def do_get(self, data):
         params = data.split()
+        if params and params[0] == '-r':
+            return self.get_r(params[1:])
+
+        workers = self.get_workers
+        if len(params) > 1 and params[0] == '-p':
+            if not params[1].isdigit() or int(params[1]) < 1:
+                return 'Incorrect parameters'
+            workers = int(params[1])
+            params = params[2:]
+
         if len(params) == 1:
             localfile = remotefile = params[0]
         elif len(params) == 2:
@@ -243,8 +1336,53 @@ class HdfsServer(RestServer):
         if remotefile[0] != '/':
             remotefile = f'{self.cwd}/{remotefile}'
 
-        with open(localfile, 'w') as fd:
-            fd.write(self.Get(self.weburl + remotefile, 'cat', text=True))
+        fs = self.stat(remotefile)
+        if fs is None or fs.get('type') != 'FILE':
+            return 'File not found'
+
+        # downloaded to a .part file, resumed from where it stopped unless
+        # the remote file changed since, renamed once complete
+        partfile = localfile + PART_SUFFIX
+        length = fs.get('length', 0)
+        offset = 0
+        if os.path.isfile(partfile):
+            st = os.stat(partfile)
+            if st.st_size <= length and \
+                    st.st_mtime * 1000 >= fs.get('modificationTime', 0):
+                offset = st.st_size
+
+        if offset == 0 and workers > 1 and length > self.range_size:
+            failed = self.get_ranges(remotefile, partfile, length, workers,
+                                     fs.get('blockSize'))
+            if failed:
+                return 'Failed %d ranges, get again to resume' % len(failed)
+        elif offset < length or not os.path.isfile(partfile):
+            progress = Progress(localfile, length)
+            progress.done = offset
+            if not self.get_file(remotefile, partfile, progress, offset):
+                return 'Interrupted at %d bytes, get again to resume' % (
+                    os.path.getsize(partfile)
+                    if os.path.isfile(partfile) else 0)
+            progress.finish()
+
+        os.replace(partfile, localfile)
+        return {'status': 'OK'}
+
+    def get_r(self, params):
+        if len(params) == 1:
+            remotedir = params[0]
+            localdir = os.path.basename(remotedir.rstrip('/'))
+        elif len(params) == 2:
+            remotedir, localdir = params
+        else:
+            return 'Incorrect parameters'
+        if not self.is_dir(remotedir):
+            return 'Not a directory: %s' % remotedir
+
+        if os.path.isdir(localdir):
+            localdir = os.path.join(localdir,
+                                    os.path.basename(remotedir.rstrip('/')))
+        return self.get_tree(remotedir, localdir)
  
     def do_rename(self, data):
         params = data.split()
@@ -261,39 +1399,120 @@ class HdfsServer(RestServer):
                         params={'destination': destname})
 
     def do_chmod(self, data):
-        params = data.split()
-        if len(params) != 2:
+        flags, params = get_flags(data.split(), ('-n', '-R'))
+        if len(params) < 2:
             return 'Incorrect parameters'
 
-        perm, filename = params
-        if filename[0] != '/':
-            filename = f'{self.cwd}/{filename}'
-        r = self.Put(self.weburl + filename,
-                     'chmod',
-                     params={'permission': perm},
-                     text=True)
-
-        return {'status': 'OK'} if r is not None else 'Failed'
+        perm, patterns = params[0], params[1:]
+        return self.bulk(
+            lambda f: self.Put(self.weburl + f,
+                               'chmod',
+                               params={'permission': perm},
+                               text=True),
+            self.expand(patterns, '-R' in flags), '-n' in flags)
 
     def do_chown(self, data):
-        params = data.split()
-        if len(params) != 2:
+        flags, params = get_flags(data.split(), ('-n', '-R'))
+        if len(params) < 2:
             return 'Incorrect parameters'
 
-        owner, filename = params
-        if filename[0] != '/':
-            filename = f'{self.cwd}/{filename}'
+        owner, patterns = params[0], params[1:]
         group = None
         if owner.count(':') == 1:
             owner, group = owner.split(':')
 
-        r = self.Put(self.weburl + filename,
-                     'chown',
-                     params={'owner': owner,
-                             'group': group},
-                     text=True)
+        return self.bulk(
+            lambda f: self.Put(self.weburl + f,
+                               'chown',
+                               params={'owner': owner,
+                                       'group': group},
+                               text=True),
+            self.expand(patterns, '-R' in flags), '-n' in flags)
 
-        return {'status': 'OK'} if r is not None else 'Failed'
+
+class AsyncHdfsServer(AsyncRestServer, HdfsServer):
+    """ HdfsServer with awaitable Get/Put/Post/Delete
+
+        The commands and the tree walks of HdfsServer block on their
+        requests, they are left out; astat, aexist, ais_dir, als and
+        astat_all are the awaitable lookups.
+    """
+
+    async def two_step(self, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(HdfsServer.two_step, self, *args, **kwargs))
+
+    def get_home(self):
+        # needed by cwd and abspath, so it stays a blocking call
+        r = RestServer.Request(self, 'GET', self.weburl,
+                               user=self.user,
+                               params={'op': get_opstr('home')})
+        return r.get('Path') if isinstance(r, dict) else None
+
+    # the cached status is forgotten again once the change is done, a
+    # lookup made in between may have cached the old one
+
+    async def Delete(self, url, recursive=False):
+        r = await HdfsServer.Delete(self, url, recursive)
+        self.changed(url)
+        return r
+
+    async def Put(self, url, op, params=None, **kwargs):
+        if params is None: params = {}
+        r = await HdfsServer.Put(self, url, op, params, **kwargs)
+        self.changed(url, params.get('destination'))
+        return r
+
+    async def Post(self, url, op, params=None, **kwargs):
+        r = await HdfsServer.Post(self, url, op, params, **kwargs)
+        self.changed(url)
+        return r
+
+    async def astat(self, path):
+        r = await self.Get(self.weburl + self.abspath(path), 'stat')
+        if r is None: return
+        return FileStatus.from_json(r.get('FileStatus'))
+
+    async def aexist(self, path):
+        return await self.astat(path) is not None
+
+    async def ais_dir(self, path):
+        fs = await self.astat(path)
+        return fs is not None and fs.get('type', '') == 'DIRECTORY'
+
+    async def als(self, path):
+        r = await self.Get(self.weburl + self.abspath(path), 'ls')
+        if r is None or not r.get('FileStatuses'): return
+        return [FileStatus.from_json(fs)
+                for fs in r['FileStatuses']['FileStatus']]
+
+    async def astat_all(self, paths, limit=None):
+        """ GETFILESTATUS of all the paths, limit requests in flight """
+        return await self.gather((self.astat(p) for p in paths), limit)
+
+
+def blocking(name):
+
+    def hidden(self):
+        raise AttributeError("'%s' object has no attribute '%s', it blocks "
+                             "on its requests" % (type(self).__name__, name))
+
+    return property(hidden)
+
+
+# what sends its requests through Get/Put/Post/Delete and waits for the
+# answers, it would get coroutines from AsyncHdfsServer
+BLOCKING = ('stat', 'exist', 'is_dir', 'list_pages', 'list_status', 'ls',
+            'walk', 'put_file', 'get_file', 'copy_file', 'put_tree',
+            'copy_tree', 'get_tree', 'find', 'du', 'glob', 'expand', 'bulk',
+            'checksum', 'same_checksum', 'sync', 'put_r', 'cp_r', 'read',
+            'last_lines', 'follow', 'get_range', 'get_ranges', 'get_r')
+
+for name in BLOCKING + tuple(name for name in vars(HdfsServer)
+                             if name.startswith('do_') and name != 'do_lls'):
+    setattr(AsyncHdfsServer, name, blocking(name))
 
 
 #
@@ -306,4 +1525,5 @@ if __name__ == '__main__':
     opt.host = 'localhost'
     opt.port = 9870
     server = HdfsServer(opt)
-    print(server.do_ls('/user'))
+    for line in server.do_ls('/user'):
+        print(line)
@@ -0,0 +1,632 @@
+"""
+   a local stand-in for the WebHDFS, Ambari and Ranger rest apis,
+   to benchmark and try the clients without a cluster
+"""
+
+#exports
+__all__ = ("MockServer", )
+
+import bisect
+import gzip
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlparse
+
+HDFS_ROOT = "/webhdfs/v1"
+AMBARI_ROOT = "/api/v1"
+RANGER_ROOT = "/service"
+
+BLOCK_SIZE = 128 * 1024 * 1024
+
+# redirected by the namenode to a datanode, like the real WebHDFS
+TWO_STEP_OPS = ("CREATE", "APPEND", "OPEN", "GETFILECHECKSUM")
+NAMENODE_RPC = "mock:8020"
+BYTES_PER_CRC = 512
+GZIP_MIN = 256  # bytes of a reply body gzipped by a compressing mock
+
+
+def crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ (0x82F63B78 if crc & 1 else 0)
+        table.append(crc)
+    return table
+
+CRC32C = crc32c_table()
+
+
+def crc32c(data):
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc = CRC32C[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class Node(object):
+    """ a file or a directory of the in-memory filesystem """
+    __slots__ = ("status", "children", "data")
+
+    next_id = [16386]
+
+    def __init__(self, name, directory=False, owner="hdfs", group="hdfs",
+                 permission=None, data=b""):
+        Node.next_id[0] += 1
+        self.children = {} if directory else None
+        self.data = bytearray(data)
+        self.status = {
+            "accessTime": 0 if directory else now_ms(),
+            "blockSize": 0 if directory else BLOCK_SIZE,
+            "childrenNum": 0,
+            "fileId": Node.next_id[0],
+            "group": group,
+            "length": 0,
+            "modificationTime": now_ms(),
+            "owner": owner,
+            "pathSuffix": name,
+            "permission": permission or ("755" if directory else "644"),
+            "replication": 0 if directory else 3,
+            "storagePolicy": 0,
+            "type": "DIRECTORY" if directory else "FILE",
+        }
+
+    @property
+    def is_dir(self):
+        return self.children is not None
+
+    def get_status(self, name=None):
+        status = dict(self.status)
+        if name is not None:
+            status["pathSuffix"] = name
+        if self.is_dir:
+            status["childrenNum"] = len(self.children)
+        else:
+            status["length"] = len(self.data)
+        return status
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # send the headers and the body in one segment, no delayed ack stalls
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def reply(self, status, body=b"", content_type="application/json",
+              headers=None):
+        if not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client closed a stream it did not read to the end
+            self.close_connection = True
+
+    def tag(self, status, body, content_type="application/json",
+            headers=None):
+        """ the reply with an ETag, a 304 if the client has it already """
+        if not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode("utf-8")
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        headers = dict(headers or {}, ETag=etag)
+        if self.headers.get("If-None-Match") == etag:
+            return 304, b"", content_type, headers
+        return status, body, content_type, headers
+
+    def encode(self, status, body, content_type="application/json",
+               headers=None):
+        """ the reply gzipped, if big enough and the client takes it """
+        if not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode("utf-8")
+        if len(body) < GZIP_MIN or \
+                "gzip" not in self.headers.get("Accept-Encoding", ""):
+            return status, body, content_type, headers
+        headers = dict(headers or {}, **{"Content-Encoding": "gzip"})
+        return status, gzip.compress(body, 1), content_type, headers
+
+    def handle_request(self, method):
+        mock = self.server.mock
+        body = self.read_body()
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        uri = urlparse(self.path)
+        path = unquote(uri.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(uri.query).items())
+        with mock.lock:
+            mock.requests += 1
+            mock.received += len(body)
+            fault = mock.faults.pop(0) if mock.faults else None
+        if fault is not None:
+            self.reply(*fault)
+            return
+
+        for root, handler in ((HDFS_ROOT, mock.hdfs),
+                              (AMBARI_ROOT, mock.ambari),
+                              (RANGER_ROOT, mock.ranger)):
+            if path == root or path.startswith(root + "/"):
+                result = handler(method, path[len(root):] or "/", params,
+                                 body)
+                if method == "GET" and mock.etags and result[0] == 200:
+                    result = self.tag(*result)
+                if mock.compress:
+                    result = self.encode(*result)
+                self.reply(*result)
+                return
+
+        self.reply(404, {"message": "Not Found"})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+def not_found(path):
+    return 404, {"RemoteException": {
+        "exception": "FileNotFoundException",
+        "javaClassName": "java.io.FileNotFoundException",
+        "message": "File does not exist: %s" % path}}
+
+
+class MockServer(object):
+    """ in-memory WebHDFS, Ambari and Ranger server on a local port
+
+        latency is added to every request. The filesystem is filled with
+        mkdirs/mkfile/populate, the Ambari hosts and Ranger policies are
+        generated from the constructor arguments. With redirect, CREATE,
+        APPEND and OPEN are sent to a datanode (the same port) in two steps.
+        With compress, the replies are gzipped for the clients taking it.
+        With etags, the GET replies carry an ETag and are revalidated with
+        a 304. fail() makes the next requests fail.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, hosts=10,
+                 alerts=50, policies=100, policy_size=256, redirect=True,
+                 ls_limit=1000, etags=False, compress=False):
+        self.latency = latency
+        self.redirect = redirect
+        self.ls_limit = ls_limit  # entries of a LISTSTATUS_BATCH page
+        self.lock = threading.RLock()
+        self.requests = 0
+        self.redirects = 0
+        self.received = 0  # request body bytes
+        self.etags = etags
+        self.compress = compress
+        self.faults = []  # the replies of the next requests
+
+        self.root = Node("", directory=True)
+        self.mkdirs("/user/hdfs")
+        self.mkdirs("/tmp", permission="777")
+
+        self.cluster = "mock"
+        self.hosts = ["host%04d.mock" % i for i in range(hosts)]
+        self.services = {"HDFS": ["NAMENODE", "DATANODE"],
+                         "YARN": ["RESOURCEMANAGER", "NODEMANAGER"],
+                         "ZOOKEEPER": ["ZOOKEEPER_SERVER"]}
+        self.alerts = alerts
+        self.policies = [{"id": i,
+                          "name": "policy-%d" % i,
+                          "service": "cm_hdfs",
+                          "isEnabled": True,
+                          "description": "x" * policy_size,
+                          "resources": {"path": {"values": ["/data/%d" % i]}},
+                          "policyItems": [{"users": ["hdfs"],
+                                           "accesses": [{"type": "read"}]}]}
+                         for i in range(policies)]
+
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.httpd.server_address[0]
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return "http://%s:%d" % (self.host, self.port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+# the filesystem
+    def lookup(self, path):
+        node = self.root
+        for name in path.strip("/").split("/"):
+            if not name:
+                continue
+            if not node.is_dir or name not in node.children:
+                return None
+            node = node.children[name]
+        return node
+
+    def mkdirs(self, path, permission=None, owner="hdfs"):
+        with self.lock:
+            node = self.root
+            for name in path.strip("/").split("/"):
+                if not name:
+                    continue
+                child = node.children.get(name)
+                if child is None:
+                    child = node.children[name] = Node(
+                        name, directory=True, permission=permission,
+                        owner=owner, group=owner)
+                    node.status["modificationTime"] = now_ms()
+                elif not child.is_dir:
+                    return None
+                node = child
+            return node
+
+    def mkfile(self, path, data=b"", owner="hdfs"):
+        with self.lock:
+            parent, _, name = path.rstrip("/").rpartition("/")
+            directory = self.mkdirs(parent or "/")
+            if directory is None:
+                return None
+            node = directory.children[name] = Node(name, data=data,
+                                                   owner=owner, group=owner)
+            directory.status["modificationTime"] = now_ms()
+            return node
+
+    def populate(self, path, count, size=0):
+        """ create count files of size bytes under path """
+        data = b"x" * size
+        for i in range(count):
+            self.mkfile("%s/part-%06d" % (path.rstrip("/"), i), data)
+
+    def fail(self, status=503, count=1, retry_after=None):
+        """ answer the next count requests with status """
+        headers = {} if retry_after is None \
+                     else {"Retry-After": str(retry_after)}
+        with self.lock:
+            self.faults.extend([(status, {"message": "injected failure"},
+                                 "application/json", headers)] * count)
+
+    def hdfs(self, method, path, params, body):
+        op = params.get("op", "").upper()
+        user = params.get("user.name", "hdfs")
+        handler = getattr(self, "hdfs_%s_%s" % (method.lower(), op.lower()),
+                          None)
+        if handler is None:
+            return 400, {"RemoteException": {
+                "exception": "IllegalArgumentException",
+                "message": "Invalid value for webhdfs parameter \"op\""}}
+        if self.redirect and op in TWO_STEP_OPS and \
+                "namenoderpcaddress" not in params:
+            return self.hdfs_redirect(path, params)
+        with self.lock:
+            return handler(path, params, body, user)
+
+    def hdfs_redirect(self, path, params):
+        """ the namenode step, the body (if any) is dropped
+
+            Like WebHDFS, a CREATE is redirected without looking at the
+            path, the DataNode refuses an existing one once the body is in.
+        """
+        with self.lock:
+            node = self.lookup(path)
+            if params["op"].upper() != "CREATE":
+                if node is None or node.is_dir:
+                    return not_found(path)
+            self.redirects += 1
+        query = dict((k, v) for k, v in params.items() if k != "noredirect")
+        query["namenoderpcaddress"] = NAMENODE_RPC
+        location = "%s%s%s?%s" % (self.url, HDFS_ROOT, quote(path),
+                                  urlencode(query))
+        if params.get("noredirect", "false") == "true":
+            return 200, {"Location": location}
+        return 307, b"", "application/octet-stream", {"Location": location}
+
+    def hdfs_get_gethomedirectory(self, path, params, body, user):
+        return 200, {"Path": "/user/%s" % user}
+
+    def hdfs_get_getfilestatus(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is None:
+            return not_found(path)
+        return 200, {"FileStatus": node.get_status("")}
+
+    def hdfs_get_liststatus(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is None:
+            return not_found(path)
+        if not node.is_dir:
+            statuses = [node.get_status("")]
+        else:
+            statuses = [child.get_status()
+                        for _, child in sorted(node.children.items())]
+        return 200, {"FileStatuses": {"FileStatus": statuses}}
+
+    def hdfs_get_liststatus_batch(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is None:
+            return not_found(path)
+        if not node.is_dir:
+            statuses, remaining = [node.get_status("")], 0
+        else:
+            names = sorted(node.children)
+            start = bisect.bisect_right(names, params.get("startAfter", ""))
+            page = names[start:start + self.ls_limit]
+            statuses = [node.children[name].get_status() for name in page]
+            remaining = len(names) - start - len(page)
+        return 200, {"DirectoryListing": {
+            "partialListing": {"FileStatuses": {"FileStatus": statuses}},
+            "remainingEntries": remaining}}
+
+    def hdfs_get_open(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is None or node.is_dir:
+            return not_found(path)
+        offset = int(params.get("offset", 0))
+        length = params.get("length")
+        end = len(node.data) if length is None else offset + int(length)
+        return 200, bytes(node.data[offset:end]), "application/octet-stream"
+
+    def hdfs_get_getfilechecksum(self, path, params, body, user):
+        """ MD5 of the block MD5s of the CRC32Cs of each 512 bytes """
+        node = self.lookup(path)
+        if node is None or node.is_dir:
+            return not_found(path)
+        data = bytes(node.data)
+        block_size = node.status["blockSize"]
+        md5s = [hashlib.md5(b"".join(
+                    struct.pack(">I", crc32c(data[i:i + BYTES_PER_CRC]))
+                    for i in range(start, min(start + block_size, len(data)),
+                                   BYTES_PER_CRC))).digest()
+                for start in range(0, len(data), block_size)]
+        crc_per_block = block_size // BYTES_PER_CRC if len(md5s) > 1 else 0
+        return 200, {"FileChecksum": {
+            "algorithm": "MD5-of-%dMD5-of-%dCRC32C" % (crc_per_block,
+                                                      BYTES_PER_CRC),
+            "bytes": (struct.pack(">iq", BYTES_PER_CRC, crc_per_block) +
+                      hashlib.md5(b"".join(md5s)).digest()).hex(),
+            "length": 28}}
+
+    def hdfs_put_create(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is not None and \
+                (node.is_dir or params.get("overwrite", "false") != "true"):
+            return 403, {"RemoteException": {
+                "exception": "FileAlreadyExistsException",
+                "message": "%s already exists" % path}}
+        if self.mkfile(path, body, owner=user) is None:
+            return 403, {"RemoteException": {
+                "exception": "ParentNotDirectoryException",
+                "message": "Parent path is not a directory: %s" % path}}
+        return 201, b"", "application/octet-stream", \
+               {"Location": "hdfs://mock%s" % path}
+
+    def hdfs_post_append(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is None or node.is_dir:
+            return not_found(path)
+        node.data.extend(body)
+        node.status["modificationTime"] = now_ms()
+        return 200, b"", "application/octet-stream"
+
+    def hdfs_put_mkdirs(self, path, params, body, user):
+        node = self.mkdirs(path, params.get("permission"), owner=user)
+        return 200, {"boolean": node is not None}
+
+    def hdfs_put_rename(self, path, params, body, user):
+        node = self.lookup(path)
+        destination = params.get("destination", "")
+        parent, _, name = destination.rstrip("/").rpartition("/")
+        target = self.lookup(parent or "/")
+        if node is None or target is None or not target.is_dir or \
+                name in target.children:
+            return 200, {"boolean": False}
+        source, _, old_name = path.rstrip("/").rpartition("/")
+        del self.lookup(source or "/").children[old_name]
+        node.status["pathSuffix"] = name
+        target.children[name] = node
+        return 200, {"boolean": True}
+
+    def hdfs_delete_delete(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is None or path.strip("/") == "":
+            return 200, {"boolean": False}
+        if node.is_dir and node.children and \
+                params.get("recursive", "false") != "true":
+            return 403, {"RemoteException": {
+                "exception": "PathIsNotEmptyDirectoryException",
+                "message": "%s is non empty" % path}}
+        parent, _, name = path.rstrip("/").rpartition("/")
+        del self.lookup(parent or "/").children[name]
+        return 200, {"boolean": True}
+
+    def hdfs_put_setpermission(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is None:
+            return not_found(path)
+        node.status["permission"] = params.get("permission", "755")
+        return 200, b"", "application/octet-stream"
+
+    def hdfs_put_setowner(self, path, params, body, user):
+        node = self.lookup(path)
+        if node is None:
+            return not_found(path)
+        if params.get("owner"):
+            node.status["owner"] = params["owner"]
+        if params.get("group") not in (None, "None"):
+            node.status["group"] = params["group"]
+        return 200, b"", "application/octet-stream"
+
+# ambari
+    def ambari(self, method, path, params, body):
+        if method != "GET":
+            return 202, {"Requests": {"id": 1, "status": "Accepted"}}
+
+        parts = path.strip("/").split("/")
+        base = "%s%s" % (AMBARI_ROOT, path)
+        if parts == ["hosts"] or parts[2:] == ["hosts"]:
+            return 200, {"href": base, "items": [
+                {"href": "%s/%s" % (base, host),
+                 "Hosts": {"cluster_name": self.cluster, "host_name": host}}
+                for host in self.hosts]}
+        if parts == ["clusters"]:
+            return 200, {"href": base, "items": [
+                {"Clusters": {"cluster_name": self.cluster,
+                              "version": "HDP-3.1"}}]}
+        if len(parts) < 2 or parts[1] != self.cluster:
+            return 404, {"status": 404, "message": "Not found"}
+        if len(parts) == 2:
+            return 200, {"href": base,
+                         "Clusters": {"cluster_name": self.cluster,
+                                      "total_hosts": len(self.hosts)},
+                         "services": [{"ServiceInfo": {"service_name": s}}
+                                      for s in sorted(self.services)]}
+        if parts[2] == "alert_definitions":
+            return 200, {"href": base, "items": [
+                {"AlertDefinition": {"id": i, "name": "alert_%d" % i,
+                                     "label": "Alert %d" % i}}
+                for i in range(self.alerts)]}
+        if parts[2] == "services" and len(parts) == 3:
+            return 200, {"href": base, "items": [
+                {"ServiceInfo": {"cluster_name": self.cluster,
+                                 "service_name": s}}
+                for s in sorted(self.services)]}
+        if parts[2] == "services" and parts[3] in self.services:
+            components = [{"ServiceComponentInfo": {
+                              "component_name": c,
+                              "service_name": parts[3]}}
+                          for c in self.services[parts[3]]]
+            if len(parts) == 4:
+                return 200, {"href": base,
+                             "ServiceInfo": {"service_name": parts[3],
+                                             "state": "STARTED"},
+                             "components": components}
+            return 200, {"href": base, "ServiceComponentInfo": {
+                "component_name": parts[-1], "state": "STARTED"}}
+        if parts[2] == "hosts" and len(parts) >= 5 and \
+                parts[4] == "host_components":
+            return 200, {"href": base, "items": [
+                {"HostRoles": {"cluster_name": self.cluster,
+                               "component_name": c,
+                               "host_name": parts[3]}}
+                for c in ("DATANODE", "NODEMANAGER")]}
+        return 404, {"status": 404, "message": "Not found"}
+
+# ranger
+    def ranger(self, method, path, params, body):
+        match = re.match(r"^/xusers/users/userName/([^/]+)$", path)
+        if match:
+            return 200, {"id": 1, "name": match.group(1),
+                         "userSource": 1, "status": 1,
+                         "groupIdList": [1, 2]}
+        match = re.match(r"^/xusers/(\d+)/groups$", path)
+        if match:
+            return 200, {"totalCount": 2, "vXGroups": [
+                {"id": 1, "name": "hadoop"}, {"id": 2, "name": "users"}]}
+
+        match = re.match(r"^/public/v2/api(?:/service/([^/]+))?/policy"
+                         r"(?:/([^/]+))?$", path)
+        if match is None:
+            return 404, {"statusCode": 1, "msgDesc": "Not found"}
+
+        service, name = match.groups()
+        if method == "POST":
+            policy = json.loads(body or b"{}")
+            policy["id"] = len(self.policies)
+            self.policies.append(policy)
+            return 200, policy
+
+        policies = [p for p in self.policies
+                    if service is None or p.get("service") == service]
+        if name is not None:
+            policies = [p for p in policies if p.get("name") == name]
+            if not policies:
+                return 404, {"statusCode": 1, "msgDesc": "Not found"}
+            return 200, policies[0]
+        return 200, policies
+
+
+#
+# ---- main ----
+if __name__ == "__main__":
+    from optparse import OptionParser
+
+    parser = OptionParser()
+    parser.add_option("--host", default="127.0.0.1")
+    parser.add_option("--port", type=int, default=9870)
+    parser.add_option("--latency", type=float, default=0.0,
+                      help="Seconds added to each request, [default: %default]")
+    parser.add_option("--files", type=int, default=100,
+                      help="Files under /tmp/data, [default: %default]")
+    parser.add_option("--file-size", type=int, default=1024,
+                      help="Bytes per file, [default: %default]")
+    parser.add_option("--hosts", type=int, default=10,
+                      help="Ambari hosts, [default: %default]")
+    parser.add_option("--no-redirect", action="store_true", default=False,
+                      help="Serve CREATE/APPEND/OPEN without a datanode step")
+
+    opts, args = parser.parse_args()
+
+    server = MockServer(opts.host, opts.port, opts.latency, opts.hosts,
+                        redirect=not opts.no_redirect)
+    server.populate("/tmp/data", opts.files, opts.file_size)
+    print("Mock WebHDFS/Ambari/Ranger on %s" % server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
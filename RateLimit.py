@@ -0,0 +1,164 @@
+#exports
+__all__ = (
+    "TokenBucket",
+    "ServiceLimiter",
+    "get_limiter", )
+
+import threading
+import time
+
+from collections import deque
+
+from RestStats import Histogram
+
+STATUS_TOOMANY = 429
+STATUS_UNAVAILABLE = 503
+
+MIN_RATE = 0.5  # requests per second the backoff never goes below
+BACKOFF = 0.5  # rate multiplier on a 429/503
+RECOVERY = 0.05  # fraction of the target rate regained per success
+RECOVER_RATE = 1000.0  # an unlimited service is unlimited again above this
+RATE_WINDOW = 1.0  # seconds of completed requests the recent rate is of
+
+
+class TokenBucket(object):
+    """ token bucket of rate tokens per second, rate None is unlimited """
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst
+        # full, down to burst at the first token taken at a rate
+        self.__tokens = float("inf")
+        self.__last = time.monotonic()
+        self.__paused = 0.0
+        self.__lock = threading.Lock()
+
+    def pause(self, seconds):
+        """ hand out no token for the next seconds """
+        with self.__lock:
+            self.__paused = max(self.__paused, time.monotonic() + seconds)
+
+    def acquire(self):
+        """ take a token, sleeping until there is one """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                if now < self.__paused:
+                    wait = self.__paused - now
+                elif self.rate is None:
+                    self.__tokens = float("inf")
+                    return
+                else:
+                    burst = self.burst or max(self.rate, 1.0)
+                    self.__tokens = min(burst, self.__tokens +
+                                        (now - self.__last) * self.rate)
+                    self.__last = now
+                    if self.__tokens >= 1.0:
+                        self.__tokens -= 1.0
+                        return
+                    wait = (1.0 - self.__tokens) / self.rate
+            time.sleep(wait)
+
+
+class ServiceLimiter(object):
+    """ requests per second and in-flight caps of one rest service
+
+        A 429 or 503 halves the current rate (and honors Retry-After),
+        every success then regains a bit of it until the configured rate.
+        The rate of an unlimited service is the one of its recent requests,
+        left unlimited when there are too few of them to tell.
+    """
+
+    def __init__(self, rate=None, max_inflight=None):
+        self.rate = rate
+        self.max_inflight = max_inflight
+        self.bucket = TokenBucket(rate)
+        self.queue_time = Histogram()
+        self.inflight = 0
+        self.requests = self.throttled = 0
+
+        self.__slots = None if max_inflight is None \
+                            else threading.BoundedSemaphore(max_inflight)
+        self.__lock = threading.Lock()
+        self.__completed = deque()  # of the last RATE_WINDOW seconds
+
+    def configure(self, rate=None, max_inflight=None):
+        with self.__lock:
+            self.rate = self.bucket.rate = rate
+            if max_inflight != self.max_inflight:
+                self.max_inflight = max_inflight
+                self.__slots = None if max_inflight is None \
+                               else threading.BoundedSemaphore(max_inflight)
+
+    @property
+    def observed_rate(self):
+        """ requests per second completed during the last RATE_WINDOW
+            seconds, None with less than two of them
+        """
+        completed = self.__completed
+        if len(completed) < 2 or completed[-1] == completed[0]:
+            return None
+        return (len(completed) - 1) / (completed[-1] - completed[0])
+
+    def __count(self):
+        now = time.monotonic()
+        self.__completed.append(now)
+        while self.__completed[0] < now - RATE_WINDOW:
+            self.__completed.popleft()
+
+    def __adapt(self, resp):
+        with self.__lock:
+            self.__count()
+            if resp is None:
+                return
+
+            if resp.status_code in (STATUS_TOOMANY, STATUS_UNAVAILABLE):
+                self.throttled += 1
+                current = self.bucket.rate or self.observed_rate
+                if current is not None:
+                    self.bucket.rate = max(current * BACKOFF, MIN_RATE)
+                retry_after = resp.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    self.bucket.pause(int(retry_after))
+            elif self.bucket.rate != self.rate and resp.status_code < 400:
+                target = self.rate or RECOVER_RATE
+                current = self.bucket.rate + target * RECOVERY
+                if current >= target:
+                    current = self.rate
+                self.bucket.rate = current
+
+    def call(self, send, method, url, **kwargs):
+        """ send(method, url, ...) once a slot and a token are available """
+        start = time.perf_counter()
+        slots = self.__slots
+        if slots is not None:
+            slots.acquire()
+        try:
+            self.bucket.acquire()
+            with self.__lock:
+                self.queue_time.add(time.perf_counter() - start)
+                self.inflight += 1
+                self.requests += 1
+            try:
+                resp = send(method, url, **kwargs)
+            finally:
+                with self.__lock:
+                    self.inflight -= 1
+        finally:
+            if slots is not None:
+                slots.release()
+
+        self.__adapt(resp)
+        return resp
+
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+
+def get_limiter(service):
+    """ the limiter shared by all the clients of a service url """
+    with limiters_lock:
+        if service not in limiters:
+            limiters[service] = ServiceLimiter()
+        return limiters[service]
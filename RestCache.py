@@ -0,0 +1,215 @@
+#exports
+__all__ = ("ResponseCache",
+           "StatusCache", )
+
+import re
+import requests
+import threading
+import time
+
+from collections import OrderedDict
+
+CACHE_TTL = 60  # seconds a response is served without revalidation
+CACHE_SIZE = 16 * 1024 * 1024  # bytes of response bodies kept
+STATUS_TTL = 10  # seconds a file status is trusted
+STATUS_SIZE = 10000  # file statuses kept
+
+STATUS_OK = requests.codes.ok  # 200
+STATUS_NOTMODIFIED = requests.codes.not_modified  # 304
+
+
+def get_path(url):
+    """ the path of url, without scheme, host and query string, so that a
+        write sent to another host (a DataNode) matches the cached reads
+    """
+    url = url.split("?", 1)[0]
+    if "://" in url:
+        url = url.split("://", 1)[1]
+        url = "/" + url.split("/", 1)[1] if "/" in url else "/"
+    return url.rstrip("/")
+
+
+class CacheEntry(object):
+    __slots__ = ("resp", "size", "expires", "etag", "modified")
+
+    def __init__(self, resp, ttl):
+        self.resp = resp
+        self.size = len(resp.content or b"")
+        self.expires = time.time() + ttl
+        self.etag = resp.headers.get("ETag")
+        self.modified = resp.headers.get("Last-Modified")
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires
+
+    @property
+    def validators(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+        return headers
+
+
+class ResponseCache(object):
+    """ LRU cache of GET responses with per-endpoint ttls
+
+        Responses are kept as they came (a requests.Response with its body
+        read), so a hit goes through the same status code handling as a
+        miss. Expired entries with an ETag or Last-Modified are revalidated
+        with a conditional GET, and any other method invalidates the cached
+        responses sharing its resource prefix.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_size=CACHE_SIZE, ttls=()):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.ttls = [(re.compile(pattern), seconds)
+                     for pattern, seconds in ttls]
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.size = 0
+        self.hits = self.misses = self.revalidated = self.evictions = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get_ttl(self, url):
+        for pattern, seconds in self.ttls:
+            if pattern.search(url):
+                return seconds
+        return self.ttl
+
+    def set_ttl(self, pattern, seconds):
+        """ set the ttl of the urls matching pattern, 0 to always revalidate
+        """
+        self.ttls = [(p, s) for p, s in self.ttls if p.pattern != pattern]
+        self.ttls.insert(0, (re.compile(pattern), seconds))
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def invalidate(self, url):
+        """ drop the entries on the same resource prefix as url """
+        path = get_path(url)
+        with self.__lock:
+            for key in list(self.__entries):
+                cached = get_path(key[1])
+                if cached.startswith(path) or path.startswith(cached):
+                    self.__remove(key)
+
+    def __remove(self, key):
+        entry = self.__entries.pop(key)
+        self.size -= entry.size
+
+    def __store(self, key, entry):
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            if entry.size > self.max_size:
+                return
+
+            self.__entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_size:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+
+    def __lookup(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                self.__entries.move_to_end(key)
+            return entry
+
+    def fetch(self, send, method, url, auth=None, headers=None, **kwargs):
+        """ send(method, url, auth=, headers=, ...) unless cached """
+        if method != "GET":
+            self.invalidate(url)
+            return send(method, url, auth=auth, headers=headers, **kwargs)
+
+        key = (method, url, auth)
+        ttl = self.get_ttl(url)
+        entry = self.__lookup(key)
+        if entry is not None:
+            if entry.fresh:
+                self.hits += 1
+                return entry.resp
+            if entry.validators:
+                headers = dict(headers or {}, **entry.validators)
+
+        resp = send(method, url, auth=auth, headers=headers, **kwargs)
+        if resp is None:
+            return resp
+
+        if resp.status_code == STATUS_NOTMODIFIED and entry is not None:
+            self.revalidated += 1
+            entry.expires = time.time() + ttl
+            return entry.resp
+
+        self.misses += 1
+        if resp.status_code == STATUS_OK:
+            entry = CacheEntry(resp, ttl)
+            if ttl > 0 or entry.validators:
+                self.__store(key, entry)
+        return resp
+
+
+class StatusCache(object):
+    """ LRU cache of the status of the files by path, each trusted for ttl
+        seconds
+
+        A change to a path drops it, its parent (whose size and times
+        change too) and, for a directory, everything under it.
+    """
+
+    def __init__(self, ttl=STATUS_TTL, max_size=STATUS_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def get(self, path):
+        with self.__lock:
+            entry = self.__entries.get(path)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(path)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, path, status):
+        if self.ttl <= 0:
+            return
+        with self.__lock:
+            self.__entries[path] = (time.time() + self.ttl, status)
+            self.__entries.move_to_end(path)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, path):
+        path = path.rstrip("/") or "/"
+        with self.__lock:
+            entry = self.__entries.pop(path, None)
+            self.__entries.pop(path.rpartition("/")[0] or "/", None)
+            if entry is not None and entry[1].get("type") == "FILE":
+                return
+
+            prefix = path.rstrip("/") + "/"
+            for key in [k for k in self.__entries if k.startswith(prefix)]:
+                del self.__entries[key]
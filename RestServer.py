@@ -6,11 +6,20 @@ __all__ = (
     "STATUS_CREATED",
     "STATUS_NOCONTENT", )
 
+import functools
+import gzip
 import json
 import re
 import requests
 import sys
-
+import threading
+import time
+
+from Cassette import Cassette
+from RateLimit import get_limiter
+from RestCache import ResponseCache, CACHE_TTL, CACHE_SIZE
+from RestStats import RequestStats, TimedAdapter
+from Retry import RetryPolicy, RETRIES, breakers
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
@@ -22,62 +31,79 @@ STATUS_FORBIDDEN = requests.codes.forbidden  # 403
 STATUS_NOTFOUND = requests.codes.not_found  # 404
 STATUS_NOTALLOW = requests.codes.not_allowed  # 405
 
+POOL_CONNECTIONS = 10  # number of per-host pools to keep
+POOL_MAXSIZE = 10  # connections kept alive per host
+POOL_IDLE = 60  # seconds before an idle session is dropped
+CHUNK_SIZE = 64 * 1024  # bytes read at a time from a streamed response
+ACCEPT_ENCODING = "gzip, deflate"
+QUERY_SAFE = "/,:*"  # left as is in the query values, readable and harmless
+
+
+def make_url(url, user=None, params=None):
+    if sys.version_info.major >= 3:
+        from urllib.parse import urlparse, quote
+    else:
+        from urlparse import urlparse
+        from urllib import quote
 
-def Request(method,
-            url,
-            user=None,
-            auth=None,
-            params=None,
-            data=None,
-            headers=None,
-            proxies=None,
-            curl=False,
-            text=False,
-            expected=(STATUS_OK, )):
     if params is None:
         params = {}
     else:
         if isinstance(params, str):
+            # a query string, already escaped
             params = dict(p.split("=") for p in params.split("&"))
+        else:
+            # a file name with + & # or a space in it must come back as is
+            params = dict((k, quote(str(v), safe=QUERY_SAFE))
+                          for k, v in params.items())
 
     if user:
         params["user.name"] = user
 
     paramstr = "&".join("%s=%s" % (k, v) for k, v in params.items())
 
-    if sys.version_info.major >= 3:
-        from urllib.parse import urlparse
-    else:
-        from urlparse import urlparse
-
     uri = urlparse(url)
 
     if len(params) > 0:
         url = url + ("&" if len(uri.query) > 0 else "?") + paramstr
 
-    if curl:
-        print("curl -X {method}{auth}{header}{data}{url}".format(
-            method=method,
-            auth="" if auth is None else " -u '%s:%s'" % (auth),
-            header="" if headers is None else " -H '" + ",".join("%s:%s" % (
-                k, v) for k, v in headers.items()) + "'",
-            data="" if data is None else " -d '%s'" % data,
-            url=(" -k '%s'" if url.startswith("https") else " '%s'") % url))
+    return url
 
+
+def print_curl(method, url, auth=None, data=None, headers=None):
+    print("curl -X {method}{auth}{header}{data}{url}".format(
+        method=method,
+        auth="" if auth is None else " -u '%s:%s'" % (auth),
+        header="" if headers is None else " -H '" + ",".join("%s:%s" % (
+            k, v) for k, v in headers.items()) + "'",
+        data="" if data is None else " -d '%s'" % data,
+        url=(" -k '%s'" if url.startswith("https") else " '%s'") % url))
+
+
+def iter_response(resp, text=False, chunk_size=CHUNK_SIZE):
+    """ iterate over the lines (text) or chunks of a streamed response """
     try:
-        resp = requests.request(
-            method,
-            url,
-            auth=auth,
-            verify=False,
-            data=data,
-            headers=headers,
-            proxies=proxies)
-    except requests.exceptions.ConnectionError:
-        return None
+        if text:
+            if resp.encoding is None:
+                resp.encoding = "utf-8"
+            for line in resp.iter_lines(chunk_size, decode_unicode=True):
+                yield line
+        else:
+            for chunk in resp.iter_content(chunk_size):
+                yield chunk
+    finally:
+        resp.close()
 
+
+def get_result(resp,
+               text=False,
+               expected=(STATUS_OK, ),
+               stream=False,
+               chunk_size=CHUNK_SIZE):
     try:
         if resp.status_code in expected:
+            if stream:
+                return iter_response(resp, text, chunk_size)
             return resp.text if text else resp.json()
         elif resp.status_code == STATUS_CREATED:
             return {"status": "created"}
@@ -99,10 +125,70 @@ def Request(method,
                 "error": str(e),
                 "text": resp.text
             }
+    finally:
+        if stream and resp.status_code not in expected:
+            resp.close()
+
+
+def gzip_body(data, headers=None):
+    """ gzip a request body, returning the new body and headers """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    headers = dict(headers or {})
+    headers["Content-Encoding"] = "gzip"
+    return gzip.compress(data), headers
+
+
+def send(method, url, session=None, **kwargs):
+    """ send a request, return the response or None if it cannot connect
+        or times out
+    """
+    try:
+        return (requests if session is None else session).request(
+            method, url, verify=False, **kwargs)
+    except (requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout):
+        return None
+
+
+def Request(method,
+            url,
+            user=None,
+            auth=None,
+            params=None,
+            data=None,
+            headers=None,
+            proxies=None,
+            curl=False,
+            text=False,
+            expected=(STATUS_OK, ),
+            session=None,
+            stream=False,
+            chunk_size=CHUNK_SIZE):
+    url = make_url(url, user, params)
+
+    if curl:
+        print_curl(method, url, auth, data, headers)
+
+    resp = send(method,
+                url,
+                session,
+                auth=auth,
+                data=data,
+                headers=headers,
+                proxies=proxies,
+                stream=stream)
+    if resp is None:
+        return None
+
+    return get_result(resp, text, expected, stream, chunk_size)
 
 
 class RestServer(object):
     """ base class for all rest client """
+    cache_ttls = ()  # (url pattern, seconds) overriding the cache ttl
+    compress_body = True  # the service takes gzipped request bodies
 
     def __init__(self, opts):
         self.prefix = getattr(opts, "prefix", "http")
@@ -114,6 +200,45 @@ class RestServer(object):
         self.proxies = {"http": None, "https": None}
         self.curl = False
 
+        self.pool_connections = getattr(opts, "pool_size", POOL_CONNECTIONS)
+        self.pool_maxsize = getattr(opts, "pool_maxsize", POOL_MAXSIZE)
+        self.pool_idle = getattr(opts, "pool_idle", POOL_IDLE)
+        self.chunk_size = getattr(opts, "chunk_size", CHUNK_SIZE)
+
+        self.accept_encoding = getattr(opts, "accept_encoding",
+                                       ACCEPT_ENCODING)
+        self.compress_threshold = getattr(opts, "compress_threshold", None) \
+                                  if self.compress_body else None
+
+        self.stats = RequestStats()
+
+        self.timeout = getattr(opts, "timeout", None)
+        self.retry = RetryPolicy(getattr(opts, "retries", RETRIES),
+                                 hedge=getattr(opts, "hedge", None))
+
+        self.cassette = None
+        if getattr(opts, "record", None):
+            self.cassette = Cassette(opts.record, "record")
+        elif getattr(opts, "replay", None):
+            self.cassette = Cassette(opts.replay, "replay",
+                                     getattr(opts, "realtime", False))
+
+        if getattr(opts, "max_rate", None) or \
+                getattr(opts, "max_inflight", None):
+            self.limiter.configure(getattr(opts, "max_rate", None),
+                                   getattr(opts, "max_inflight", None))
+
+        self.cache = None
+        self.cache_ttl = getattr(opts, "cache_ttl", CACHE_TTL)
+        self.cache_size = getattr(opts, "cache_size", CACHE_SIZE)
+        if getattr(opts, "cache", False):
+            self.do_cache("on")
+
+        self.__session = None
+        self.__session_lock = threading.RLock()
+        self.__last_used = 0
+        self.__pool_history = {}
+
     @property
     def auth(self):
         return (self.user, self.passwd)
@@ -126,9 +251,141 @@ class RestServer(object):
     def proxy(self):
         return json.dumps(self.proxies)
 
-    def Request(self, method, url, **kwargs):
-        return Request(
-            method, url, curl=self.curl, proxies=self.proxies, **kwargs)
+    @property
+    def service(self):
+        return self.baseurl + getattr(self, "rootpath", "")
+
+    @property
+    def limiter(self):
+        """ the rate/concurrency limiter shared by the clients of service """
+        return get_limiter(self.service)
+
+    @property
+    def session(self):
+        """ the keep-alive session, recreated after pool_idle seconds """
+        with self.__session_lock:
+            now = time.time()
+            if self.__session is not None and \
+                    now - self.__last_used > self.pool_idle:
+                self.close_session()
+
+            if self.__session is None:
+                adapter = TimedAdapter(pool_connections=self.pool_connections,
+                                       pool_maxsize=self.pool_maxsize)
+                self.__session = requests.Session()
+                self.__session.headers["Accept-Encoding"] = \
+                    self.accept_encoding
+                self.__session.mount("http://", adapter)
+                self.__session.mount("https://", adapter)
+
+            self.__last_used = now
+            return self.__session
+
+    def close(self):
+        self.close_session()
+
+    def close_session(self):
+        """ close all the pooled connections, keeping their counters """
+        with self.__session_lock:
+            if self.__session is None:
+                return
+
+            for key, counts in self.pool_counts().items():
+                self.__pool_history[key] = counts
+            self.__session.close()
+            self.__session = None
+
+    def pool_counts(self):
+        """ return {(scheme, host, port): (connections, requests)} """
+        counts = dict(self.__pool_history)
+        if self.__session is None:
+            return counts
+
+        for adapter in set(self.__session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                key = (pool.scheme, pool.host, pool.port)
+                conns, reqs = self.__pool_history.get(key, (0, 0))
+                counts[key] = (conns + pool.num_connections,
+                               reqs + pool.num_requests)
+        return counts
+
+    def get_operation(self, method, url):
+        """ name of the operation a request is accounted to in the stats """
+        path, _, query = url.partition("?")
+        for param in query.split("&"):
+            if param.startswith("op="):
+                return param[3:]
+
+        # keep the collections of /collection/id/collection/id... paths
+        path = path[len(self.service):]
+        return "%s /%s" % (method, "/".join(path.strip("/").split("/")[::2]))
+
+    def transport(self, method, url, data=None, headers=None, **kwargs):
+        """ send a prepared url over the session, recording its stats
+
+            A body of at least compress_threshold bytes is sent gzipped.
+            With a cassette, the interactions are recorded or replayed.
+        """
+        raw_size = None
+        if self.compress_threshold is not None and \
+                isinstance(data, (bytes, str)) and \
+                len(data) >= self.compress_threshold:
+            raw_size = len(data)
+            data, headers = gzip_body(data, headers)
+
+        wire = send if self.cassette is None \
+                    else functools.partial(self.cassette.send, send)
+        return self.stats.record(self.get_operation(method, url), wire,
+                                 method, url, raw_size,
+                                 session=self.session, data=data,
+                                 headers=headers, timeout=self.timeout,
+                                 **kwargs)
+
+    def send(self, method, url, **kwargs):
+        """ send a prepared url through the cache (unless streaming), the
+            retry policy and the limiter of the service
+        """
+        transport = functools.partial(self.limiter.call, self.transport)
+        if self.retry is not None:
+            hedge_after = None
+            if self.retry.hedge is not None:
+                hedge_after = self.stats.percentile(
+                    self.get_operation(method, url), self.retry.hedge)
+            transport = functools.partial(self.retry.call, transport,
+                                          hedge_after=hedge_after)
+
+        if self.cache is None or kwargs.get("stream"):
+            return transport(method, url, **kwargs)
+
+        return self.cache.fetch(transport, method, url, **kwargs)
+
+    def Request(self,
+                method,
+                url,
+                user=None,
+                params=None,
+                text=False,
+                expected=(STATUS_OK, ),
+                stream=False,
+                chunk_size=None,
+                **kwargs):
+        url = make_url(url, user, params)
+
+        if self.curl:
+            print_curl(method, url, kwargs.get("auth"), kwargs.get("data"),
+                       kwargs.get("headers"))
+
+        resp = self.send(method, url, proxies=self.proxies, stream=stream,
+                         **kwargs)
+        if resp is None:
+            return None
+
+        return get_result(resp, text, expected, stream,
+                          chunk_size or self.chunk_size)
 
     def Get(self, url, **kwargs):
         return self.Request("GET", url, **kwargs)
@@ -172,6 +429,157 @@ class RestServer(object):
     def do_curl(self, data):
         self.curl = data.upper() == "ON"
 
+    def do_cache(self, data=""):
+        params = data.split()
+        if len(params) == 0:
+            if self.cache is None:
+                return "cache is OFF"
+            return [("ENTRIES", "BYTES", "HITS", "MISSES", "REVALIDATED",
+                     "EVICTIONS"),
+                    [(len(self.cache), self.cache.size, self.cache.hits,
+                      self.cache.misses, self.cache.revalidated,
+                      self.cache.evictions)]]
+
+        if params[0].upper() == "ON":
+            if self.cache is None:
+                self.cache = ResponseCache(self.cache_ttl, self.cache_size,
+                                           self.cache_ttls)
+        elif params[0].upper() == "OFF":
+            self.cache = None
+        elif params[0] == "clear":
+            if self.cache is not None:
+                self.cache.clear()
+        elif params[0] == "ttl" and len(params) == 3:
+            if self.cache is not None:
+                self.cache.set_ttl(params[1], float(params[2]))
+        else:
+            return "Incorrect parameters"
+
+    def do_stats(self, data=""):
+        params = data.split()
+        if len(params) == 0:
+            return [("OP", "COUNT", "P50(ms)", "P95(ms)", "P99(ms)",
+                     "TTFB P50(ms)", "CONNECT(ms)", "BYTES IN", "BYTES OUT",
+                     "STATUS"),
+                    self.stats.lines()]
+
+        if params[0] == "reset":
+            self.stats.reset()
+        elif params[0] == "json":
+            if len(params) > 1:
+                with open(params[1], "w") as f:
+                    f.write(self.stats.to_json())
+            else:
+                return self.stats.to_dict()
+        else:
+            return "Incorrect parameters"
+
+    def do_compress(self, data=""):
+        params = data.split()
+        if len(params) == 0:
+            return [("OP", "WIRE IN", "BYTES IN", "SAVED", "WIRE OUT",
+                     "BYTES OUT", "SAVED"),
+                    self.stats.compression_lines()]
+
+        if params[0].upper() in ("ON", "OFF"):
+            self.accept_encoding = ACCEPT_ENCODING \
+                                   if params[0].upper() == "ON" else "identity"
+            self.session.headers["Accept-Encoding"] = self.accept_encoding
+        elif params[0] == "body" and len(params) == 2 and self.compress_body:
+            self.compress_threshold = None if params[1].upper() == "OFF" \
+                                      else int(params[1])
+        else:
+            return "Incorrect parameters"
+
+    def do_limit(self, data=""):
+        params = data.split()
+        limiter = self.limiter
+        if len(params) == 0:
+            number = lambda n: "-" if n is None else "%g" % n
+            queue = limiter.queue_time
+            return [("SERVICE", "RATE", "CURRENT RATE", "MAX INFLIGHT",
+                     "INFLIGHT", "REQUESTS", "THROTTLED", "QUEUE P50(ms)",
+                     "QUEUE P99(ms)"),
+                    [(self.service, number(limiter.rate),
+                      number(limiter.bucket.rate),
+                      number(limiter.max_inflight), limiter.inflight,
+                      limiter.requests, limiter.throttled,
+                      "%.1f" % (queue.percentile(50) * 1000),
+                      "%.1f" % (queue.percentile(99) * 1000))]]
+
+        if len(params) > 2:
+            return "Incorrect parameters"
+
+        to_number = lambda s, convert: \
+                    None if s.upper() == "OFF" else convert(s)
+        limiter.configure(to_number(params[0], float),
+                          to_number(params[1], int) if len(params) > 1
+                                                    else limiter.max_inflight)
+
+    def do_cassette(self, data=""):
+        params = data.split()
+        if len(params) == 0:
+            if self.cassette is None:
+                return "cassette is OFF"
+            return "%s %s: %d interactions, %d missed" % (
+                self.cassette.mode, self.cassette.path, self.cassette.count,
+                self.cassette.missed)
+
+        if params[0].upper() == "OFF":
+            self.cassette = None
+        elif params[0] in ("record", "replay") and len(params) in (2, 3):
+            self.cassette = Cassette(params[1], params[0],
+                                     params[2:] == ["realtime"])
+        else:
+            return "Incorrect parameters"
+
+    def do_retry(self, data=""):
+        params = data.split()
+        if len(params) == 0:
+            if self.retry is None:
+                return "retry is OFF"
+            return [("RETRIES", "BACKOFF", "HEDGE", "RETRIED", "HEDGED",
+                     "REJECTED"),
+                    [(self.retry.retries, self.retry.backoff,
+                      "-" if self.retry.hedge is None
+                          else "p%g" % self.retry.hedge,
+                      self.retry.retried, self.retry.hedged,
+                      self.retry.rejected)]]
+
+        if params[0].upper() == "OFF":
+            self.retry = None
+            return
+
+        if self.retry is None:
+            self.retry = RetryPolicy(0)
+        if params[0] == "hedge" and len(params) == 2:
+            self.retry.hedge = None if params[1].upper() == "OFF" \
+                               else float(params[1])
+        elif params[0].isdigit() and len(params) <= 2:
+            self.retry.retries = int(params[0])
+            if len(params) == 2:
+                self.retry.backoff = float(params[1])
+        else:
+            return "Incorrect parameters"
+
+    def do_breaker(self, data=""):
+        if data == "reset":
+            breakers.clear()
+            return
+
+        return [("HOST", "STATE", "FAILURES", "REJECTED"),
+                [(host, breaker.state, breaker.failures, breaker.rejected)
+                 for host, breaker in sorted(breakers.items())]]
+
+    def do_pool(self, data=""):
+        lines = []
+        for (scheme, host, port), (conns, reqs) in \
+                sorted(self.pool_counts().items()):
+            lines.append(("%s://%s:%s" % (scheme, host, port),
+                          conns, reqs, max(reqs - conns, 0)))
+
+        return [("HOST", "CONNECTIONS", "REQUESTS", "REUSED"), lines]
+
 
 if __name__ == "__main__":
     server = RestServer()
@@ -0,0 +1,273 @@
+#exports
+__all__ = (
+    "Histogram",
+    "RequestStats",
+    "TimedAdapter", )
+
+import bisect
+import json
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection, \
+                                                 HTTPSConnection
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, \
+                                                     HTTPSConnectionPool
+
+HIST_MIN = 0.0001  # seconds, upper bound of the first bucket
+HIST_GROWTH = 1.2  # ratio between two bucket bounds
+HIST_BUCKETS = 80  # up to ~200s, anything above goes to the last bucket
+
+PERCENTILES = (50, 95, 99)
+HEDGE_MIN_COUNT = 20  # requests of an op before its percentiles are used
+
+# connect time of the requests running on the current thread
+timings = threading.local()
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super(TimedHTTPConnection, self).connect()
+        finally:
+            timings.connect = getattr(timings, "connect", 0.0) + \
+                              time.perf_counter() - start
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super(TimedHTTPSConnection, self).connect()
+        finally:
+            timings.connect = getattr(timings, "connect", 0.0) + \
+                              time.perf_counter() - start
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """ HTTPAdapter whose new connections time their DNS/connect/TLS """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool}
+
+
+def body_size(body):
+    """ size of a request body, files and streams included when known """
+    try:
+        return len(body) if body is not None else 0
+    except TypeError:
+        return 0
+
+
+class Histogram(object):
+    """ fixed size histogram over log scaled buckets """
+    bounds = [HIST_MIN * HIST_GROWTH ** i for i in range(HIST_BUCKETS)]
+
+    def __init__(self):
+        self.counts = [0] * HIST_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = min(bisect.bisect_left(self.bounds, value), HIST_BUCKETS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        """ the upper bound of the bucket holding the pct-th percentile """
+        if self.count == 0:
+            return 0.0
+
+        rank = pct * 0.01 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        result = {"count": self.count, "mean": self.mean, "max": self.max}
+        for pct in PERCENTILES:
+            result["p%d" % pct] = self.percentile(pct)
+        return result
+
+
+class OpStats(object):
+    def __init__(self):
+        self.connect = Histogram()
+        self.ttfb = Histogram()
+        self.total = Histogram()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.wire_in = 0
+        self.wire_out = 0
+        self.status = {}
+
+    def to_dict(self):
+        return {"connect": self.connect.to_dict(),
+                "ttfb": self.ttfb.to_dict(),
+                "total": self.total.to_dict(),
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "wire_in": self.wire_in,
+                "wire_out": self.wire_out,
+                "status": dict(self.status)}
+
+
+class RequestStats(object):
+    """ per operation timings, sizes and status codes of the requests """
+
+    def __init__(self):
+        self.__ops = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__ops)
+
+    def reset(self):
+        with self.__lock:
+            self.__ops.clear()
+
+    def add(self, op, status, total, ttfb=0.0, connect=0.0,
+            bytes_in=0, bytes_out=0, wire_in=None, wire_out=None):
+        with self.__lock:
+            stats = self.__ops.setdefault(op, OpStats())
+            if connect:
+                stats.connect.add(connect)
+            stats.ttfb.add(ttfb)
+            stats.total.add(total)
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            stats.wire_in += bytes_in if wire_in is None else wire_in
+            stats.wire_out += bytes_out if wire_out is None else wire_out
+            stats.status[status] = stats.status.get(status, 0) + 1
+
+    def record(self, op, send, method, url, raw_size=None, **kwargs):
+        """ send(method, url, ...) and account it to op
+
+            raw_size is the size of the body before it was compressed. A
+            streamed response is accounted once closed, its body read.
+        """
+        wire_out = body_size(kwargs.get("data"))
+        bytes_out = wire_out if raw_size is None else raw_size
+
+        timings.connect = 0.0
+        start = time.perf_counter()
+        resp = send(method, url, **kwargs)
+        total = time.perf_counter() - start
+
+        if resp is None:
+            self.add(op, "error", total, connect=timings.connect,
+                     bytes_out=bytes_out, wire_out=wire_out)
+        elif kwargs.get("stream"):
+            self.record_stream(op, resp, start, timings.connect,
+                               bytes_out, wire_out)
+        else:
+            bytes_in = len(resp.content or b"")
+            wire_in = resp.raw.tell() if resp.raw is not None else bytes_in
+            self.add(op, resp.status_code, total,
+                     ttfb=resp.elapsed.total_seconds(),
+                     connect=timings.connect,
+                     bytes_in=bytes_in,
+                     bytes_out=bytes_out,
+                     wire_in=wire_in,
+                     wire_out=wire_out)
+        return resp
+
+    def record_stream(self, op, resp, start, connect, bytes_out, wire_out):
+        """ count the bytes of the body of resp as they are read, and
+            account it to op when resp is closed
+        """
+        received = [0]
+        iter_content, close = resp.iter_content, resp.close
+
+        def counted(*args, **kwargs):
+            for chunk in iter_content(*args, **kwargs):
+                received[0] += len(chunk) if isinstance(chunk, bytes) \
+                               else len(chunk.encode("utf-8"))
+                yield chunk
+
+        def closed():
+            resp.iter_content, resp.close = iter_content, close
+            self.add(op, resp.status_code, time.perf_counter() - start,
+                     ttfb=resp.elapsed.total_seconds(),
+                     connect=connect,
+                     bytes_in=received[0],
+                     bytes_out=bytes_out,
+                     wire_in=resp.raw.tell() if resp.raw is not None
+                             else received[0],
+                     wire_out=wire_out)
+            close()
+
+        resp.iter_content, resp.close = counted, closed
+
+    def percentile(self, op, pct, min_count=HEDGE_MIN_COUNT):
+        """ the pct-th percentile of the total time of op, None until
+            min_count requests were recorded
+        """
+        with self.__lock:
+            stats = self.__ops.get(op)
+            if stats is None or stats.total.count < min_count:
+                return None
+            return stats.total.percentile(pct)
+
+    def to_dict(self):
+        with self.__lock:
+            return dict((op, stats.to_dict())
+                        for op, stats in self.__ops.items())
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4, sort_keys=True)
+
+    def lines(self):
+        """ rows of op, count, p50/p95/p99 total ms, ttfb and connect """
+        lines = []
+        for op, stats in sorted(self.to_dict().items()):
+            total = stats["total"]
+            lines.append((op, total["count"],
+                          "%.1f" % (total["p50"] * 1000),
+                          "%.1f" % (total["p95"] * 1000),
+                          "%.1f" % (total["p99"] * 1000),
+                          "%.1f" % (stats["ttfb"]["p50"] * 1000),
+                          "%.1f" % (stats["connect"]["mean"] * 1000),
+                          stats["bytes_in"],
+                          stats["bytes_out"],
+                          ",".join("%s:%d" % item
+                                   for item in sorted(stats["status"].items(),
+                                                      key=str))))
+        return lines
+
+    def compression_lines(self):
+        """ rows of op, wire and decoded bytes in both directions """
+        saved = lambda wire, size: \
+                "%.1f%%" % (100.0 - 100.0 * wire / size) if size else "-"
+
+        lines = []
+        for op, stats in sorted(self.to_dict().items()):
+            lines.append((op,
+                          stats["wire_in"], stats["bytes_in"],
+                          saved(stats["wire_in"], stats["bytes_in"]),
+                          stats["wire_out"], stats["bytes_out"],
+                          saved(stats["wire_out"], stats["bytes_out"])))
+        return lines
@@ -0,0 +1,202 @@
+#exports
+__all__ = (
+    "RetryPolicy",
+    "CircuitBreaker",
+    "get_breaker", )
+
+import random
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+RETRIES = 3
+BACKOFF = 0.2  # seconds, base of the exponential backoff
+MAX_BACKOFF = 10.0
+
+SAFE = ("GET", "HEAD", "OPTIONS")
+# the WebHDFS operations giving the same result when sent twice; a
+# RENAME, DELETE, APPEND or CREATE without overwrite fail or change again
+IDEMPOTENT_OPS = ("MKDIRS", "SETPERMISSION", "SETOWNER", "SETREPLICATION",
+                  "SETTIMES", "SETACL", "MODIFYACLENTRIES", "REMOVEACLENTRIES",
+                  "REMOVEDEFAULTACL", "REMOVEACL")
+RETRY_STATUSES = (429, 502, 503, 504)
+REFUSED_STATUSES = (429, 503)  # the request was turned down, not processed
+FAILURE_STATUSES = (502, 503, 504)  # counted by the circuit breakers
+
+BREAKER_THRESHOLD = 5  # consecutive failures opening a breaker
+BREAKER_RESET = 30.0  # seconds before an open breaker lets a trial through
+
+HEDGE_WORKERS = 16
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+def get_host(url):
+    return url.split("://", 1)[-1].split("/", 1)[0]
+
+
+def get_op(url):
+    """ the WebHDFS operation of url, upper case, None without one """
+    m = re.search(r"[?&]op=([A-Za-z]+)", url)
+    return m.group(1).upper() if m else None
+
+
+def is_idempotent(method, url):
+    if method in SAFE:
+        return True
+    op = get_op(url)
+    if op == "CREATE":
+        return re.search(r"[?&]overwrite=true", url) is not None
+    return op in IDEMPOTENT_OPS
+
+
+def close(future):
+    """ close the response of a hedged request which lost """
+    if not future.cancelled() and future.exception() is None and \
+            future.result() is not None:
+        future.result().close()
+
+
+class CircuitBreaker(object):
+    """ fail fast while a host keeps failing, then probe it once """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.__opened = 0.0
+        self.__lock = threading.Lock()
+
+    def allow(self):
+        with self.__lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and \
+                    time.monotonic() - self.__opened >= self.reset:
+                self.state = HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self.__lock:
+            self.state = CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.state = OPEN
+                self.__opened = time.monotonic()
+
+
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    """ the circuit breaker of the host of url """
+    host = get_host(url)
+    with breakers_lock:
+        if host not in breakers:
+            breakers[host] = CircuitBreaker()
+        return breakers[host]
+
+
+class RetryPolicy(object):
+    """ retries with jittered exponential backoff, hedging of the slow
+        reads and per host circuit breakers
+
+        The idempotent requests are retried on any failure, the others only
+        when the server refused them with a 429 or 503.
+    """
+    executor = None
+    executor_lock = threading.Lock()
+
+    def __init__(self, retries=RETRIES, backoff=BACKOFF,
+                 max_backoff=MAX_BACKOFF, hedge=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge  # percentile of the latency a read is hedged at
+        self.retried = self.hedged = self.rejected = 0
+
+    def delay(self, attempt):
+        """ full jitter: uniform in [0, backoff * 2^attempt] """
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+    def can_retry(self, kwargs):
+        # a file or generator body cannot be sent twice
+        data = kwargs.get("data")
+        return data is None or isinstance(data, (bytes, str))
+
+    def send_hedged(self, send, method, url, after, **kwargs):
+        """ send again if no response came within after seconds, and take
+            the first of the two
+        """
+        with RetryPolicy.executor_lock:
+            if RetryPolicy.executor is None:
+                RetryPolicy.executor = ThreadPoolExecutor(HEDGE_WORKERS)
+
+        first = self.executor.submit(send, method, url, **kwargs)
+        done, _ = wait([first], timeout=after)
+        if done:
+            return first.result()
+
+        self.hedged += 1
+        second = self.executor.submit(send, method, url, **kwargs)
+        pending = [first, second]
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                resp = future.result()
+                if resp is not None:
+                    other = second if future is first else first
+                    other.add_done_callback(close)
+                    return resp
+        return None
+
+    def call(self, send, method, url, hedge_after=None, **kwargs):
+        """ send(method, url, ...) with retries, hedging and breaker """
+        breaker = get_breaker(url)
+        attempts = 1 + (self.retries if self.can_retry(kwargs) else 0)
+        statuses = RETRY_STATUSES if is_idempotent(method, url) \
+                   else REFUSED_STATUSES
+        hedge = hedge_after is not None and method == "GET" and \
+                not kwargs.get("stream")
+
+        resp = None
+        for attempt in range(attempts):
+            if attempt > 0:
+                self.retried += 1
+                time.sleep(self.delay(attempt - 1))
+
+            if not breaker.allow():
+                self.rejected += 1
+                return None
+
+            if hedge:
+                resp = self.send_hedged(send, method, url, hedge_after,
+                                        **kwargs)
+            else:
+                resp = send(method, url, **kwargs)
+
+            if resp is None or resp.status_code in FAILURE_STATUSES:
+                breaker.failure()
+            else:
+                breaker.success()
+
+            if resp is None and statuses is REFUSED_STATUSES:
+                # it may have been processed before the connection broke
+                return resp
+            if resp is not None and resp.status_code not in statuses:
+                return resp
+        return resp
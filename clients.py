@@ -1,3 +1,4 @@
+import gzip
 import json
 import requests
 import sys
@@ -23,50 +24,58 @@ def get_token(auth, token_url: str = None):
 
 
 class RestServer(object):
-    def __init__(self, url, auth=(USER, PASS), using_sso=True, token_url=None):
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+    def __init__(self, url, auth=(USER, PASS), using_sso=True, token_url=None,
+                 compress_threshold=None):
         self.api_url = url
         self.auth = auth
         self.using_sso = using_sso
         self.token_url = token_url
+        self.compress_threshold = compress_threshold
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = self.ACCEPT_ENCODING
+        self.counters = {'wire_in': 0, 'bytes_in': 0,
+                         'wire_out': 0, 'bytes_out': 0}
         if self.using_sso:
             self.token = get_token(self.auth, self.token_url)
 
-    def _get(self, path):
+    def _request(self, method, path, data=None):
         url = f'{self.api_url}/{path}'
-        log_trace(f'Get {url}')
+        log_trace(f'{method.capitalize()} {url}')
+        kwargs = {'headers': dict(HEADERS)}
         if self.using_sso:
-            cookietext = {'hadoop-jwt': self.token}
-            log_trace(f'Token: {self.token}')
-            resp = requests.get(url, cookies=cookietext,
-                                headers=HEADERS, verify=False)
+            kwargs['cookies'] = {'hadoop-jwt': self.token}
+            kwargs['verify'] = False
+            if method == 'GET':
+                log_trace(f'Token: {self.token}')
         else:
-            resp = requests.get(url, auth=self.auth,
-                                headers=HEADERS)
+            kwargs['auth'] = self.auth
+
+        if data is not None:
+            body = json.dumps(data).encode('utf-8')
+            self.counters['bytes_out'] += len(body)
+            kwargs['headers']['Content-Type'] = 'application/json'
+            if self.compress_threshold is not None and \
+                    len(body) >= self.compress_threshold:
+                body = gzip.compress(body)
+                kwargs['headers']['Content-Encoding'] = 'gzip'
+            self.counters['wire_out'] += len(body)
+            kwargs['data'] = body
+
+        resp = self.session.request(method, url, **kwargs)
+        self.counters['bytes_in'] += len(resp.content)
+        self.counters['wire_in'] += resp.raw.tell()
         return resp
 
+    def _get(self, path):
+        return self._request('GET', path)
+
     def _post(self, path, data):
-        url = f'{self.api_url}/{path}'
-        log_trace(f'Post {url}')
-        if self.using_sso:
-            cookietext = {'hadoop-jwt': self.token}
-            resp = requests.post(url, cookies=cookietext,
-                                 json=data, headers=HEADERS, verify=False)
-        else:
-            resp = requests.post(url, auth=self.auth,
-                                 json=data, headers=HEADERS)
-        return resp
+        return self._request('POST', path, data)
 
     def _delete(self, path):
-        url = f'{self.api_url}/{path}'
-        log_trace(f'Delete {url}')
-        if self.using_sso:
-            cookietext = {'hadoop-jwt': self.token}
-            resp = requests.delete(url, cookies=cookietext,
-                                   headers=HEADERS, verify=False)
-        else:
-            resp = requests.delete(url, auth=self.auth,
-                                   headers=HEADERS)
-        return resp
+        return self._request('DELETE', path)
 
 
 
@@ -124,9 +133,11 @@ class ClouderaManager(RestServer):
 
 class Ranger(RestServer):
     VER = "v2"
-    def __init__(self, url, auth=(USER, PASS), using_sso=True, token_url=None):
+    def __init__(self, url, auth=(USER, PASS), using_sso=True, token_url=None,
+                 compress_threshold=None):
         super().__init__(url, auth=auth,
-                         using_sso=using_sso, token_url=token_url)
+                         using_sso=using_sso, token_url=token_url,
+                         compress_threshold=compress_threshold)
 
     def get_user_by_name(self, user):
         resp = self._get(f'service/xusers/users/userName/{user}')
@@ -152,9 +163,11 @@ class Ranger(RestServer):
 
 class Atlas(RestServer):
     VER = "v2"
-    def __init__(self, url, auth=(USER, PASS), using_sso=True, token_url=None):
+    def __init__(self, url, auth=(USER, PASS), using_sso=True, token_url=None,
+                 compress_threshold=None):
         super().__init__(f'{url}/{self.VER}', auth=auth,
-                         using_sso=using_sso, token_url=token_url)
+                         using_sso=using_sso, token_url=token_url,
+                         compress_threshold=compress_threshold)
 
     def __repr__(self):
         return f'<{self.__class__.__name__}: {self.api_url}>'
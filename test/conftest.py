@@ -1,10 +1,91 @@
-import pytest
-
-from clients import LivySession
-
-
-@pytest.fixture(scope='session')
-def g_livy():
-    livy = LivySession.get_session(name='LivyTest')
-    yield livy
-    livy.delete()
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pytest
+
+from clients import LivySession
+
+# the modules under test live one level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_REPORT = os.environ.get('BENCH_REPORT', 'bench_report.json')
+
+
+@pytest.fixture(scope='session')
+def g_livy():
+    livy = LivySession.get_session(name='LivyTest')
+    yield livy
+    livy.delete()
+
+
+@pytest.fixture(scope='session')
+def g_mock():
+    from MockServer import MockServer
+
+    with MockServer() as mock:
+        yield mock
+
+
+class Opts(object):
+    def __init__(self, mock, **kwargs):
+        self.host = mock.host
+        self.port = mock.port
+        self.user = 'hdfs'
+        self.password = 'admin'
+        self.__dict__.update(kwargs)
+
+
+@pytest.fixture
+def g_opts(g_mock):
+    return Opts(g_mock)
+
+
+@pytest.fixture
+def g_own_opts(g_mock):
+    """ opts of the mock under another host name, for the tests making it
+        fail: the breaker and the limiter they trip are dropped after. The
+        rate is high enough for the backoff of the limiter not to wait.
+    """
+    from RateLimit import limiters
+    from Retry import breakers
+
+    yield Opts(g_mock, host='localhost', max_rate=1e6)
+    breakers.pop('localhost:%d' % g_mock.port, None)
+    for service in [s for s in limiters if '//localhost:' in s]:
+        del limiters[service]
+
+
+@pytest.fixture(scope='session')
+def g_bench_report():
+    report = {}
+    yield report
+    if report:
+        with open(BENCH_REPORT, 'w') as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+
+
+@pytest.fixture
+def bench(request, g_bench_report):
+    """ time rounds calls of func, then trace the memory of one more """
+    def run(func, *args, rounds=10, **kwargs):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        g_bench_report[request.node.name] = {
+            'rounds': rounds,
+            'seconds': elapsed,
+            'ops_per_sec': rounds / elapsed if elapsed else 0.0,
+            'peak_bytes': peak}
+        return result
+
+    return run
@@ -0,0 +1,307 @@
+import asyncio
+import importlib.util
+import json
+import os
+
+import pytest
+
+from AmbariServer import AmbariServer, AsyncAmbariServer
+from FileStatus import FileStatus, FileStatuses
+from FileUtil import fileinfo, to_columns, format_columns
+from HdfsServer import HdfsServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_clients():
+    # test/clients.py shadows the top level clients module
+    spec = importlib.util.spec_from_file_location(
+        'hadoop_clients', os.path.join(ROOT, 'clients.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_hdfs_startup(bench, g_opts, g_mock):
+    requests = g_mock.requests
+    hdfs = bench(HdfsServer, g_opts, rounds=100)
+    assert g_mock.requests == requests
+
+    HdfsServer.homes.clear()
+    assert hdfs.cwd == '/user/hdfs'
+    assert HdfsServer(g_opts).cwd == '/user/hdfs'
+    assert g_mock.requests == requests + 1
+
+
+@pytest.fixture(scope='module')
+def g_files(g_mock):
+    g_mock.populate('/bench/ls', 1000, 128)
+    g_mock.mkfile('/bench/cat', b'0123456789abcdef\n' * 64 * 1024)
+    return g_mock
+
+
+@pytest.mark.parametrize('ls_limit', [1000, 100])
+def test_hdfs_ls(bench, g_opts, g_files, ls_limit):
+    g_files.ls_limit = ls_limit
+    try:
+        hdfs = HdfsServer(g_opts)
+        lines = bench(lambda: list(hdfs.do_ls('/bench/ls')), rounds=20)
+    finally:
+        g_files.ls_limit = 1000
+    assert len(lines) == 1000
+    assert lines[-1].endswith('part-000999')
+
+
+@pytest.mark.parametrize('workers', [1, 16])
+def test_hdfs_walk(bench, g_opts, g_files, workers):
+    for d in range(20):
+        g_files.populate(f'/bench/walk/d{d:02}/e', 10, 100)
+
+    hdfs = HdfsServer(g_opts)
+    hdfs.walk_workers = workers
+    files = bench(lambda: sum(len(f) for _, _, f in hdfs.walk('/bench/walk')),
+                  rounds=5)
+    assert files == 200
+    assert hdfs.du('/bench/walk')['/bench/walk'] == (200 * 100, 200)
+    assert len(list(hdfs.find('/bench/walk', name='part-00000[0-4]'))) == 100
+
+
+@pytest.mark.parametrize('status_ttl', [0, 10])
+def test_hdfs_stat(bench, g_opts, g_files, status_ttl):
+    hdfs = HdfsServer(g_opts)
+    hdfs.statuses.ttl = status_ttl
+    assert bench(hdfs.exist, '/bench/ls/part-000000', rounds=200)
+
+
+def test_hdfs_stat_invalidation(g_opts, g_files):
+    hdfs = HdfsServer(g_opts)
+    hdfs.do_mkdir('/bench/inval')
+    assert hdfs.is_dir('/bench/inval')
+    assert hdfs.stat('/bench/inval')['childrenNum'] == 0
+
+    hdfs.Put(hdfs.weburl + '/bench/inval/a', 'put', data=b'a',
+             expected=(201, ))
+    assert hdfs.stat('/bench/inval')['childrenNum'] == 1
+    assert hdfs.ls('/bench/inval')[0]['pathSuffix'] == 'a'
+
+    requests = g_files.requests
+    assert hdfs.stat('/bench/inval/a')['length'] == 1
+    assert g_files.requests == requests  # from the listing
+
+    hdfs.do_chmod('600 /bench/inval/a')
+    assert hdfs.stat('/bench/inval/a')['permission'] == '600'
+    hdfs.do_rename('/bench/inval/a /bench/inval/b')
+    assert not hdfs.exist('/bench/inval/a')
+    hdfs.do_rm('/bench/inval/b')
+    assert not hdfs.exist('/bench/inval/b')
+
+
+def test_hdfs_cat(bench, g_opts, g_files):
+    hdfs = HdfsServer(g_opts)
+    lines = bench(lambda: sum(1 for _ in hdfs.do_cat('/bench/cat')),
+                  rounds=5)
+    assert lines == 64 * 1024
+
+
+def test_hdfs_tail(bench, g_opts, g_files):
+    hdfs = HdfsServer(g_opts)
+    lines = bench(lambda: list(hdfs.do_tail('-n 3 /bench/cat')), rounds=20)
+    assert lines == ['0123456789abcdef'] * 3
+
+    # more lines than a block holds
+    lines = list(hdfs.do_tail('-n 5000 /bench/cat'))
+    assert len(lines) == 5000
+
+
+def test_hdfs_put(bench, g_opts, g_files, tmp_path):
+    localfile = tmp_path / 'put.txt'
+    localfile.write_text('x' * 1024 * 1024)
+
+    hdfs = HdfsServer(g_opts)
+    received = g_files.received
+    result = bench(hdfs.do_put, f'{localfile} /bench/put.txt', rounds=10)
+    assert result == {'status': 'OK'}
+    assert len(g_files.lookup('/bench/put.txt').data) == 1024 * 1024
+    # the body goes to the datanode only
+    assert g_files.received - received == 11 * 1024 * 1024
+
+
+def test_hdfs_put_get_tree(bench, g_opts, g_files, tmp_path):
+    src = tmp_path / 'tree'
+    for d in range(5):
+        (src / f'd{d}').mkdir(parents=True)
+        for f in range(20):
+            (src / f'd{d}' / f'f{f}').write_bytes(b'x' * 4096)
+
+    hdfs = HdfsServer(g_opts)
+    result = bench(hdfs.put_tree, str(src), '/bench/tree', rounds=3)
+    assert result.startswith('100 files')
+    assert len(g_files.lookup('/bench/tree/d4').children) == 20
+
+    dst = tmp_path / 'copy'
+    result = bench(hdfs.get_tree, '/bench/tree', str(dst), rounds=3)
+    assert result.startswith('100 files')
+    assert (dst / 'd4' / 'f19').read_bytes() == b'x' * 4096
+
+
+def test_hdfs_cp(bench, g_opts, g_files):
+    hdfs = HdfsServer(g_opts)
+
+    def cp():
+        hdfs.do_rm('/bench/cp')
+        return hdfs.do_cp('/bench/cat /bench/cp')
+
+    assert bench(cp, rounds=10) == {'status': 'OK'}
+    assert g_files.lookup('/bench/cp').data == g_files.lookup('/bench/cat').data
+
+
+def test_hdfs_bulk(bench, g_opts, g_files):
+    for d in range(4):
+        g_files.populate(f'/bench/bulk/2024-0{d}', 50)
+
+    hdfs = HdfsServer(g_opts)
+    assert hdfs.do_rm('-n /bench/bulk/2024-0[12]/part-*') == \
+        '100 paths would be changed'
+    result = bench(hdfs.do_chmod, '-R 600 /bench/bulk/2024-*', rounds=3)
+    assert result.startswith('204 done, 0 failed')
+    assert g_files.lookup('/bench/bulk/2024-03/part-000049') \
+                  .status['permission'] == '600'
+
+    assert hdfs.do_rm('/bench/bulk/2024-0[12]/part-*') \
+               .startswith('100 done, 0 failed')
+    assert len(g_files.lookup('/bench/bulk/2024-01').children) == 0
+
+
+def test_hdfs_sync(bench, g_opts, g_files, tmp_path):
+    for d in range(5):
+        (tmp_path / f'd{d}').mkdir()
+        for f in range(20):
+            (tmp_path / f'd{d}' / f'f{f}').write_bytes(os.urandom(2048))
+
+    hdfs = HdfsServer(g_opts)
+    assert hdfs.sync(str(tmp_path), '/bench/sync').startswith(
+        '0 unchanged, 0 checked\n100 files')
+
+    (tmp_path / 'd0' / 'f0').write_bytes(os.urandom(2048))
+    os.utime(tmp_path / 'd0' / 'f0', (0, 2 ** 32))
+    assert hdfs.sync(str(tmp_path), '/bench/sync', checksum=True) \
+               .startswith('99 unchanged, 1 checked\n1 files')
+
+    # the manifest spares the checksums
+    result = bench(hdfs.sync, str(tmp_path), '/bench/sync', checksum=True,
+                   rounds=5)
+    assert result.startswith('100 unchanged, 0 checked\n0 files')
+
+
+def make_statuses(count):
+    return [{'type': 'DIRECTORY' if i % 10 == 0 else 'FILE',
+             'permission': ('755', '644', '1777', '600')[i % 4],
+             'owner': 'hdfs', 'group': 'hadoop', 'length': i * 37,
+             'modificationTime': 1700000000000 + i * 7919,
+             'pathSuffix': 'part-%06d' % i}
+            for i in range(count)]
+
+
+@pytest.mark.parametrize('formatter', ['fileinfo', 'columns'])
+def test_format_listing(bench, formatter):
+    statuses = make_statuses(100000)
+    if formatter == 'fileinfo':
+        lines = bench(lambda: [fileinfo(fs) for fs in statuses], rounds=3)
+    else:
+        lines = bench(lambda: format_columns(to_columns(statuses)), rounds=3)
+    assert lines[3] == fileinfo(statuses[3])
+    assert len(lines) == 100000
+
+
+def test_format_listing_filters():
+    columns = to_columns(make_statuses(100))
+    dirs = format_columns(columns, 'd')
+    assert len(dirs) == 10 and all(line[0] == 'd' for line in dirs)
+    assert len(format_columns(columns, 'f')) == 90
+    by_size = format_columns(columns, sort='size', reverse=True)
+    assert by_size[0].endswith('part-000099')
+    assert format_columns(columns, sort='name')[0].endswith('part-000000')
+
+
+def json_pages(pages, count):
+    """ LISTSTATUS responses with all the fields of a FileStatus """
+    return [json.dumps({'FileStatuses': {'FileStatus': [
+                {'accessTime': 1700000000000 + i, 'blockSize': 134217728,
+                 'childrenNum': 0, 'fileId': 16386 + p * count + i,
+                 'group': 'hadoop', 'length': i * 37,
+                 'modificationTime': 1700000000000 + i * 7919,
+                 'owner': 'hdfs', 'pathSuffix': 'part-%06d' % (p * count + i),
+                 'permission': '644', 'replication': 3, 'storagePolicy': 0,
+                 'type': 'FILE'}
+                for i in range(count)]}})
+            for p in range(pages)]
+
+
+@pytest.mark.parametrize('container', ['dict', 'record', 'array'])
+def test_status_memory(bench, g_bench_report, request, container):
+    pages = json_pages(50, 1000)
+
+    def load():
+        entries = FileStatuses() if container == 'array' else []
+        for text in pages:
+            statuses = json.loads(text)['FileStatuses']['FileStatus']
+            if container == 'dict':
+                entries.extend(statuses)
+            else:
+                entries.extend(FileStatus.from_json(fs) for fs in statuses)
+        return entries
+
+    entries = bench(load, rounds=1)
+    report = g_bench_report[request.node.name]
+    report['bytes_per_entry'] = report['peak_bytes'] / len(entries)
+    assert len(entries) == 50000
+    assert entries[123]['pathSuffix'] == 'part-000123'
+    assert entries[123].get('length') == 123 * 37
+    # the decoded json takes about 900 bytes an entry
+    assert report['bytes_per_entry'] < \
+        {'dict': 2000, 'record': 400, 'array': 250}[container]
+
+
+def test_ambari_list_hosts(bench, g_opts):
+    ambari = AmbariServer(g_opts)
+    titles, lines = bench(ambari.list_hosts, 'mock', rounds=50)
+    assert len(lines) == 10
+
+
+def test_ambari_list_host_components(bench, g_opts):
+    ambari = AmbariServer(g_opts)
+    result = bench(ambari.list_host_components, 'mock', rounds=10)
+    assert result.count('DATANODE') == 10
+
+
+def test_ambari_async_list_host_components(bench, g_opts):
+    ambari = AsyncAmbariServer(g_opts)
+    result = bench(lambda: asyncio.run(ambari.list_host_components('mock')),
+                   rounds=10)
+    assert result.count('DATANODE') == 10
+
+
+def test_ranger_get_policies(bench, g_mock):
+    clients = load_clients()
+    ranger = clients.Ranger(g_mock.url, using_sso=False)
+    policies = bench(ranger.get_policies, rounds=20)
+    assert len(policies) == 100
+    assert ranger.get_user_by_name('hdfs')['name'] == 'hdfs'
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_hdfs_get(bench, g_opts, g_files, tmp_path, workers):
+    data = os.urandom(8 * 1024 * 1024)
+    g_files.mkfile('/bench/get.bin', data)
+    localfile = tmp_path / 'get.bin'
+
+    hdfs = HdfsServer(g_opts)
+    hdfs.range_size = 1024 * 1024
+
+    def get():
+        if localfile.exists():
+            localfile.unlink()
+        return hdfs.do_get(f'-p {workers} /bench/get.bin {localfile}')
+
+    assert bench(get, rounds=5) == {'status': 'OK'}
+    assert localfile.read_bytes() == data
@@ -0,0 +1,300 @@
+import asyncio
+import os
+
+from conftest import Opts
+from FileUtil import Progress, CRC32C_NATIVE
+from HdfsServer import HdfsServer, AsyncHdfsServer
+from RestServer import STATUS_CREATED
+
+
+def test_cp_existing_file(g_opts, g_mock):
+    g_mock.mkfile('/test/cp/src', b'new')
+    g_mock.mkfile('/test/cp/dst', b'old')
+
+    hdfs = HdfsServer(g_opts)
+    assert hdfs.do_cp('/test/cp/src /test/cp/dst') == \
+        'file /test/cp/dst already exist, cannot overwrite'
+    assert g_mock.lookup('/test/cp/dst').data == b'old'
+
+    # refused by the DataNode only, the destination is kept
+    assert not hdfs.copy_file('/test/cp/src', '/test/cp/dst',
+                              Progress('/test/cp/src'))
+    assert g_mock.lookup('/test/cp/dst').data == b'old'
+
+
+def test_cp_empty_dir(g_opts, g_mock):
+    g_mock.mkfile('/test/cp/src', b'new')
+    g_mock.mkdirs('/test/cp/empty')
+
+    hdfs = HdfsServer(g_opts)
+    assert hdfs.do_cp('/test/cp/src /test/cp/empty') == {'status': 'OK'}
+    assert g_mock.lookup('/test/cp/empty').is_dir
+    assert g_mock.lookup('/test/cp/empty/src').data == b'new'
+
+
+def test_ls_pages_odd_names(g_opts, g_mock):
+    names = ['a b', 'a#b', 'a&b', 'a+b', 'a+c', 'a%2Bd']
+    for name in names:
+        g_mock.mkfile('/test/names/' + name, b'x')
+
+    g_mock.ls_limit = 2
+    try:
+        hdfs = HdfsServer(g_opts)
+        listed = [fs['pathSuffix'] for fs in hdfs.list_status('/test/names')]
+    finally:
+        g_mock.ls_limit = 1000
+    assert listed == sorted(names)
+
+
+def test_get_resume(g_opts, g_mock, tmp_path):
+    data = b'v1,new\n' * 1000
+    g_mock.mkfile('/test/get/r.csv', data)
+    localfile = tmp_path / 'r.csv'
+    partfile = tmp_path / 'r.csv.part'
+    hdfs = HdfsServer(g_opts)
+
+    # an older local file is replaced, not resumed
+    localfile.write_bytes(b'v1,old\n')
+    assert hdfs.do_get(f'/test/get/r.csv {localfile}') == {'status': 'OK'}
+    assert localfile.read_bytes() == data
+    assert not partfile.exists()
+
+    # a partial download is resumed
+    partfile.write_bytes(data[:1234])
+    assert hdfs.do_get(f'/test/get/r.csv {localfile}') == {'status': 'OK'}
+    assert localfile.read_bytes() == data
+
+    # unless the remote file changed since
+    partfile.write_bytes(b'v0' * 100)
+    os.utime(partfile, (0, 0))
+    assert hdfs.do_get(f'/test/get/r.csv {localfile}') == {'status': 'OK'}
+    assert localfile.read_bytes() == data
+
+
+def test_async_two_step(g_opts, g_mock):
+    g_mock.mkfile('/test/async/src', b'0123456789')
+    hdfs = AsyncHdfsServer(g_opts)
+
+    async def run():
+        data = b''.join(await hdfs.Get(hdfs.weburl + '/test/async/src',
+                                       'cat', stream=True))
+        r = await hdfs.Put(hdfs.weburl + '/test/async/dst', 'put',
+                           params={'overwrite': 'false'}, data=data,
+                           text=True, expected=(STATUS_CREATED, ))
+        return data, r
+
+    data, r = asyncio.run(run())
+    assert data == b'0123456789'
+    assert r == ''
+    assert g_mock.lookup('/test/async/dst').data == data
+
+
+def test_async_lookups(g_opts, g_mock):
+    g_mock.mkfile('/test/alook/a', b'a')
+    hdfs = AsyncHdfsServer(g_opts)
+    hdfs.do_cache('on')
+
+    async def run():
+        listed = await hdfs.als('/test/alook')
+        await hdfs.Delete(hdfs.weburl + '/test/alook/a')
+        return listed, await hdfs.als('/test/alook'), \
+            await hdfs.astat_all(['/test/alook', '/test/alook/a'])
+
+    listed, after, statuses = asyncio.run(run())
+    assert [fs['pathSuffix'] for fs in listed] == ['a']
+    assert after == []
+    assert statuses[0]['type'] == 'DIRECTORY' and statuses[1] is None
+
+    # the blocking commands are not there
+    assert not hasattr(hdfs, 'do_cp') and not hasattr(hdfs, 'stat')
+    hdfs.close()
+
+
+def test_cp_no_redirect(g_opts, g_mock):
+    g_mock.mkfile('/test/direct/src', b'new')
+    g_mock.redirect = False
+    try:
+        hdfs = HdfsServer(g_opts)
+        assert hdfs.do_cp('/test/direct/src /test/direct/a') == \
+            {'status': 'OK'}
+        assert not hdfs.redirect
+        assert hdfs.do_cp('/test/direct/src /test/direct/b') == \
+            {'status': 'OK'}
+    finally:
+        g_mock.redirect = True
+    assert g_mock.lookup('/test/direct/a').data == b'new'
+    assert g_mock.lookup('/test/direct/b').data == b'new'
+
+
+def test_transfers_retry_off(g_opts, g_mock, tmp_path):
+    (tmp_path / 'up').mkdir()
+    (tmp_path / 'up' / 'a').write_bytes(b'a' * 100)
+    g_mock.mkfile('/test/off/big', b'b' * 3000)
+
+    hdfs = HdfsServer(g_opts)
+    hdfs.do_retry('off')
+    hdfs.range_size = 1000
+    assert hdfs.do_put(f'-r {tmp_path}/up /test/off/up') \
+               .startswith('1 files')
+    assert hdfs.do_get(f'-p 2 /test/off/big {tmp_path}/big') == \
+        {'status': 'OK'}
+    assert (tmp_path / 'big').read_bytes() == b'b' * 3000
+
+
+def test_tail_follow(g_opts, g_mock):
+    g_mock.mkfile('/test/log', b'one\ntwo\n')
+    hdfs = HdfsServer(g_opts)
+    hdfs.tail_interval = 0.01
+    assert list(hdfs.do_tail('-n 1 /test/log')) == ['two']
+
+    g_mock.mkfile('/test/log', b'one\ntwo\nthree\nfo')
+    assert list(hdfs.do_tail('-n 2 /test/log')) == ['three', 'fo']
+    assert list(hdfs.follow('/test/log', 8, polls=2)) == ['three']
+
+    # the partial line is kept until its end comes
+    follow = hdfs.follow('/test/log', 8)
+    assert next(follow) == 'three'
+    g_mock.mkfile('/test/log', b'one\ntwo\nthree\nfour\n')
+    assert next(follow) == 'four'
+    g_mock.mkfile('/test/log', b'five\n')
+    assert next(follow) == 'File truncated'
+    assert next(follow) == 'five'
+
+
+def test_tail_follow_partial_cached(g_opts, g_mock):
+    g_mock.mkfile('/test/log2', b'a\nfo')
+    hdfs = HdfsServer(g_opts)
+    hdfs.tail_interval = 0.01
+    hdfs.do_cache('on')
+
+    tail = hdfs.do_tail('-f /test/log2')
+    assert next(tail) == 'a'
+    g_mock.mkfile('/test/log2', b'a\nfour\n')
+    assert next(tail) == 'four'
+
+
+def test_find_mtime(g_opts, g_mock):
+    g_mock.mkfile('/test/find/new', b'x')
+    g_mock.mkfile('/test/find/old', b'x')
+    g_mock.lookup('/test/find/old').status['modificationTime'] -= \
+        3 * 24 * 3600 * 1000 + 1000
+
+    hdfs = HdfsServer(g_opts)
+    found = lambda mtime: [p for p, _ in hdfs.find('/test/find', mtime=mtime)]
+    assert found('0') == ['/test/find/new']
+    assert found('3') == ['/test/find/old']
+    assert found('+2') == ['/test/find/old']
+    assert found('-1') == ['/test/find/new']
+
+
+def test_literal_brackets(g_opts, g_mock):
+    g_mock.mkfile('/test/lit/x[1]', b'x')
+    g_mock.mkfile('/test/lit/y[1]', b'y')
+    g_mock.mkfile('/test/lit/y1', b'y')
+
+    hdfs = HdfsServer(g_opts)
+    assert hdfs.do_chmod('600 /test/lit/x[1]').startswith('1 done')
+    assert g_mock.lookup('/test/lit/x[1]').status['permission'] == '600'
+    assert hdfs.do_rm('/test/lit/x[1]').startswith('1 done')
+    assert g_mock.lookup('/test/lit/x[1]') is None
+
+    # y[1] matches y1, the [ has to be escaped
+    assert hdfs.do_rm('/test/lit/y[[]1]').startswith('1 done')
+    assert g_mock.lookup('/test/lit/y[1]') is None
+    assert g_mock.lookup('/test/lit/y1') is not None
+
+    # a pattern matching nothing is no path
+    assert hdfs.do_rm('/test/lit/zz*') == 'No match'
+    assert g_mock.lookup('/test/lit/y1') is not None
+    assert hdfs.do_mkdir('/test/lit/z[1]').startswith('1 done')
+    assert g_mock.lookup('/test/lit/z[1]').is_dir
+
+
+def test_mkdir(g_opts, g_mock):
+    hdfs = HdfsServer(g_opts)
+    assert hdfs.do_mkdir('/test/mk/logs /test/mk/2024').startswith('2 done')
+    assert g_mock.lookup('/test/mk/logs').is_dir
+    assert g_mock.lookup('/test/mk/2024').is_dir
+
+    assert hdfs.do_mkdir('-m 700 /test/mk/private').startswith('1 done')
+    assert g_mock.lookup('/test/mk/private').status['permission'] == '700'
+    assert hdfs.do_mkdir('-m /test/mk/x') == 'Incorrect parameters'
+    assert hdfs.do_mkdir('/test/mk/y 755') == 'Incorrect parameters'
+    assert g_mock.lookup('/test/mk/y') is None
+
+
+def test_redirect_after_failure(g_own_opts, g_mock):
+    g_mock.mkfile('/test/redirect/src', b'data')
+    hdfs = HdfsServer(g_own_opts)
+    hdfs.do_retry('off')
+    g_mock.fail(503)
+    assert hdfs.read('/test/redirect/src', 0, 4) is None
+    # a failed reply is no sign of a server answering by itself
+    assert hdfs.redirect
+    assert hdfs.read('/test/redirect/src', 0, 4) == b'data'
+
+
+def test_cached_ls_after_put(g_mock, tmp_path):
+    # the client on localhost, the mock redirects to 127.0.0.1
+    hdfs = HdfsServer(Opts(g_mock, host='localhost', cache=True))
+    localfile = tmp_path / 'new'
+    localfile.write_bytes(b'new')
+    g_mock.mkdirs('/test/cached')
+
+    assert hdfs.ls('/test/cached') == []
+    assert hdfs.do_put(f'{localfile} /test/cached/new') == {'status': 'OK'}
+    assert [fs['pathSuffix'] for fs in hdfs.ls('/test/cached')] == ['new']
+
+
+def test_locations_by_block(g_opts, g_mock, tmp_path):
+    g_mock.mkfile('/test/blocks/big', bytes(range(250)) * 12)
+    g_mock.lookup('/test/blocks/big').status['blockSize'] = 1000
+    hdfs = HdfsServer(g_opts)
+    hdfs.range_size = 1000
+
+    # each range is in its own block, with its own DataNodes
+    assert hdfs.do_get(f'-p 3 /test/blocks/big {tmp_path}/big') == \
+        {'status': 'OK'}
+    assert sorted(hdfs.locations['/test/blocks/big']) == [0, 1, 2]
+
+    redirects = g_mock.redirects
+    assert hdfs.read('/test/blocks/big', 1500, 10, 1000) == \
+        (bytes(range(250)) * 12)[1500:1510]
+    assert g_mock.redirects == redirects
+
+    # of an unknown block size, a ranged read asks the NameNode
+    assert hdfs.read('/test/blocks/big', 1500, 10) is not None
+    assert g_mock.redirects == redirects + 1
+
+
+def test_sync_checksum_newer_local(g_opts, g_mock, tmp_path, capsys):
+    (tmp_path / 'a').write_bytes(b'same bytes')
+    hdfs = HdfsServer(g_opts)
+    assert hdfs.do_sync(f'{tmp_path} /test/sync').startswith(
+        '0 unchanged, 0 checked\n1 files')
+
+    # touched, not changed: the checksum finds it the same
+    os.utime(tmp_path / 'a', (0, 2 ** 32))
+    received = g_mock.received
+    assert hdfs.do_sync(f'-c {tmp_path} /test/sync').startswith(
+        '1 unchanged, 1 checked\n0 files')
+    assert g_mock.received == received
+    assert ('pip install crc32c' in capsys.readouterr().err) == \
+        (not CRC32C_NATIVE)
+
+
+
+def test_get_ranges_backoff(g_own_opts, g_mock, tmp_path):
+    g_mock.mkfile('/test/ranges/big', b'r' * 3000)
+    hdfs = HdfsServer(g_own_opts)
+    hdfs.range_size = 1000
+    delays = []
+    hdfs.retry.delay = lambda attempt: delays.append(attempt) or 0.01
+
+    # a 500 is not retried by the request, its range is in the next round
+    assert hdfs.stat('/test/ranges/big') is not None
+    g_mock.fail(500)
+    assert hdfs.do_get(f'-p 2 /test/ranges/big {tmp_path}/big') == \
+        {'status': 'OK'}
+    assert (tmp_path / 'big').read_bytes() == b'r' * 3000
+    assert delays == [0]
@@ -0,0 +1,355 @@
+import asyncio
+import json
+import threading
+import time
+
+import requests
+
+from conftest import Opts
+from HdfsServer import HdfsServer, AsyncHdfsServer
+from RateLimit import TokenBucket, ServiceLimiter
+from RestCache import ResponseCache
+from RestServer import RestServer
+from RestStats import Histogram
+from Retry import RetryPolicy, get_breaker, CLOSED, OPEN
+
+
+def test_async_idle_session(g_opts, g_mock):
+    g_opts.pool_idle = 0.01
+    hdfs = AsyncHdfsServer(g_opts)
+
+    async def run():
+        first = await hdfs.astat('/')
+        time.sleep(0.05)
+        return first, await hdfs.astat('/')
+
+    executor = hdfs.executor
+    first, second = asyncio.run(run())
+    assert first is not None and second is not None
+    # the idle session was recycled, not the executor
+    assert hdfs.executor is executor
+    hdfs.close()
+
+
+def test_pool_reuse(g_opts, g_mock):
+    hdfs = HdfsServer(g_opts)
+    for _ in range(10):
+        assert hdfs.stat('/tmp', cached=False) is not None
+
+    _, lines = hdfs.do_pool()
+    assert [line[1:] for line in lines] == [(1, 10, 9)]
+
+    # a recycled idle session keeps the counts of the one before
+    hdfs.pool_idle = 0.01
+    time.sleep(0.05)
+    assert hdfs.stat('/tmp', cached=False) is not None
+    _, lines = hdfs.do_pool()
+    assert [line[1:] for line in lines] == [(2, 11, 9)]
+    hdfs.close()
+    assert hdfs.pool_counts() == {('http', g_mock.host, g_mock.port): (2, 11)}
+
+
+def test_retry_backoff(g_own_opts, g_mock):
+    hdfs = HdfsServer(g_own_opts)
+    hdfs.retry.backoff = 0.01
+
+    g_mock.fail(503, 2)
+    assert hdfs.stat('/tmp', cached=False)['type'] == 'DIRECTORY'
+    assert hdfs.retry.retried == 2
+
+    # given up after the retries, the last failure is the answer
+    hdfs.retry.retries = 1
+    g_mock.fail(503, 2)
+    assert hdfs.stat('/tmp', cached=False) is None
+    assert hdfs.retry.retried == 3
+    assert not g_mock.faults
+
+    # a RENAME may have been done before a 502, it is sent once
+    g_mock.mkfile('/test/retry/a', b'a')
+    rename = lambda dest: RestServer.Request(
+        hdfs, 'PUT', hdfs.weburl + '/test/retry/a', user=hdfs.user,
+        params={'op': 'RENAME', 'destination': dest})
+    g_mock.fail(502)
+    assert rename('/test/retry/b') == {'message': 'injected failure'}
+    assert hdfs.retry.retried == 3
+
+    # not after a 503, the server refused it
+    g_mock.fail(503)
+    assert rename('/test/retry/b') == {'boolean': True}
+    assert hdfs.retry.retried == 4
+
+
+def test_retry_delay():
+    policy = RetryPolicy(backoff=0.1, max_backoff=0.5)
+    assert all(0 <= policy.delay(2) <= 0.4 for _ in range(100))
+    assert all(policy.delay(10) <= 0.5 for _ in range(100))
+
+
+def test_retry_hedge(g_mock):
+    url = g_mock.url + '/webhdfs/v1/tmp?op=GETFILESTATUS'
+    calls = []
+
+    responses = []
+
+    def send(method, url, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            time.sleep(0.5)
+        responses.append(requests.request(method, url, stream=True,
+                                          **kwargs))
+        return responses[-1]
+
+    policy = RetryPolicy()
+    start = time.perf_counter()
+    resp = policy.call(send, 'GET', url, hedge_after=0.05)
+    assert resp.status_code == 200
+    assert time.perf_counter() - start < 0.4
+    assert policy.hedged == 1 and len(calls) == 2
+
+    # the slow one is closed once it comes
+    time.sleep(0.6)
+    slow, = [r for r in responses if r is not resp]
+    assert slow.raw.closed and not resp.raw.closed
+
+
+def test_circuit_breaker(g_own_opts, g_mock):
+    url = 'http://localhost:%d/webhdfs/v1/tmp?op=GETFILESTATUS' % g_mock.port
+    send = requests.request
+    breaker = get_breaker(url)
+    breaker.reset = 0.05
+
+    # opened by threshold failures in a row
+    g_mock.fail(503, breaker.threshold)
+    policy = RetryPolicy(retries=breaker.threshold - 1, backoff=0.001)
+    assert policy.call(send, 'GET', url).status_code == 503
+    assert breaker.state == OPEN
+
+    # then fails fast, without a request
+    requests_sent = g_mock.requests
+    assert policy.call(send, 'GET', url) is None
+    assert policy.rejected == 1 and g_mock.requests == requests_sent
+
+    # a failed trial opens it again, a good one closes it
+    time.sleep(0.06)
+    g_mock.fail(503)
+    policy = RetryPolicy(retries=0)
+    assert policy.call(send, 'GET', url).status_code == 503
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    assert policy.call(send, 'GET', url).status_code == 200
+    assert breaker.state == CLOSED
+
+
+class Reply(object):
+    """ what the limiter looks at in a response """
+
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_token_bucket():
+    # full at the start, then rate tokens per second
+    bucket = TokenBucket(rate=20, burst=2)
+    start = time.perf_counter()
+    for _ in range(2):
+        bucket.acquire()
+    assert time.perf_counter() - start < 0.02
+    for _ in range(4):
+        bucket.acquire()
+    assert 0.15 < time.perf_counter() - start < 0.4
+
+
+def test_limiter_inflight():
+    limiter = ServiceLimiter(max_inflight=2)
+    peak = []
+
+    def send(method, url):
+        peak.append(limiter.inflight)
+        time.sleep(0.02)
+        return Reply()
+
+    threads = [threading.Thread(target=limiter.call, args=(send, 'GET', '/'))
+               for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2 and limiter.requests == 6
+
+
+def test_limiter_backoff():
+    # of the configured rate
+    limiter = ServiceLimiter(rate=100)
+    limiter.call(lambda method, url: Reply(503), 'GET', '/')
+    assert limiter.bucket.rate == 50 and limiter.throttled == 1
+
+    # of the recent rate of an unlimited service, and no stall before it
+    # is known
+    limiter = ServiceLimiter()
+    limiter.call(lambda method, url: Reply(503), 'GET', '/')
+    assert limiter.bucket.rate is None
+    for _ in range(20):
+        limiter.call(lambda method, url: Reply(), 'GET', '/')
+    limiter.call(lambda method, url: Reply(429), 'GET', '/')
+    assert limiter.bucket.rate > 100
+
+    # regained by the successes
+    start = time.perf_counter()
+    while limiter.bucket.rate is not None:
+        limiter.call(lambda method, url: Reply(), 'GET', '/')
+    assert time.perf_counter() - start < 0.5
+
+
+def test_limiter_retry_after():
+    limiter = ServiceLimiter(rate=1000)
+    limiter.call(lambda method, url: Reply(429, {'Retry-After': '1'}),
+                 'GET', '/')
+    start = time.perf_counter()
+    limiter.call(lambda method, url: Reply(), 'GET', '/')
+    assert time.perf_counter() - start > 0.9
+
+
+def test_histogram_percentile():
+    histogram = Histogram()
+    assert histogram.percentile(50) == 0.0
+    for ms in range(1, 101):
+        histogram.add(ms / 1000.0)
+
+    # the upper bound of the bucket, at most 20% above
+    assert 0.050 <= histogram.percentile(50) <= 0.060
+    assert 0.099 <= histogram.percentile(99) <= 0.1
+    assert histogram.percentile(100) == histogram.max == 0.1
+    assert histogram.count == 100 and abs(histogram.mean - 0.0505) < 1e-9
+
+
+def test_stats_stream(g_opts, g_mock, tmp_path):
+    data = b'x' * 100000
+    g_mock.mkfile('/test/stats/a', data)
+    hdfs = HdfsServer(g_opts)
+
+    # a stream is timed until its body is read
+    r = hdfs.Get(hdfs.weburl + '/test/stats/a', 'cat', stream=True)
+    time.sleep(0.2)
+    assert b''.join(r) == data
+    stats = hdfs.do_stats('json')
+    assert stats['OPEN']['total']['max'] >= 0.2
+    assert stats['OPEN']['ttfb']['max'] < 0.2
+    assert stats['OPEN']['bytes_in'] >= len(data)
+
+    hdfs.do_stats(f'json {tmp_path}/stats.json')
+    with open(tmp_path / 'stats.json') as f:
+        assert json.load(f) == json.loads(json.dumps(stats))
+
+    hdfs.do_stats('reset')
+    assert hdfs.do_stats('json') == {}
+
+
+def test_compressed_replies(g_mock, tmp_path):
+    for i in range(50):
+        g_mock.mkfile('/test/gz/file%02d' % i, b'x')
+    localfile = tmp_path / 'body'
+    localfile.write_bytes(b'a' * 1000)
+
+    g_mock.compress = True
+    try:
+        # a body over the threshold, but WebHDFS would store it gzipped
+        hdfs = HdfsServer(Opts(g_mock, compress_threshold=100))
+        assert hdfs.compress_threshold is None
+        assert hdfs.do_compress('body 100') == 'Incorrect parameters'
+        assert hdfs.do_put(f'{localfile} /test/gz/body') == {'status': 'OK'}
+        assert g_mock.lookup('/test/gz/body').data == b'a' * 1000
+
+        def wire(hdfs):
+            hdfs.do_stats('reset')
+            assert len(hdfs.ls('/test/gz')) == 51
+            _, lines = hdfs.do_compress()
+            return [(line[1], line[2]) for line in lines]
+
+        # gzipped on the wire, decoded by the client
+        assert all(wire_in < bytes_in for wire_in, bytes_in in wire(hdfs))
+        hdfs.do_compress('off')
+        assert all(wire_in == bytes_in for wire_in, bytes_in in wire(hdfs))
+    finally:
+        g_mock.compress = False
+
+
+def test_cache_revalidation(g_mock):
+    g_mock.mkdirs('/test/etag')
+    url = g_mock.url + '/webhdfs/v1/test/etag?op=GETFILESTATUS'
+    g_mock.etags = True
+    try:
+        cache = ResponseCache(ttl=60)
+        first = cache.fetch(requests.request, 'GET', url)
+        requests_sent = g_mock.requests
+        assert cache.fetch(requests.request, 'GET', url) is first
+        assert cache.hits == 1 and g_mock.requests == requests_sent
+
+        # expired, revalidated with a conditional GET
+        cache.set_ttl('op=GETFILESTATUS', 0)
+        cache.clear()
+        first = cache.fetch(requests.request, 'GET', url)
+        assert cache.fetch(requests.request, 'GET', url) is first
+        assert cache.revalidated == 1
+        assert g_mock.requests == requests_sent + 2
+
+        # changed, a new body
+        g_mock.mkfile('/test/etag/a', b'a')
+        resp = cache.fetch(requests.request, 'GET', url)
+        assert resp is not first and resp.status_code == 200
+        assert resp.json()['FileStatus']['childrenNum'] == 1
+        assert cache.revalidated == 1
+    finally:
+        g_mock.etags = False
+
+
+def test_cache_invalidation(g_mock):
+    g_mock.mkfile('/test/inval/a', b'a')
+    g_mock.mkfile('/test/other', b'b')
+    urls = [g_mock.url + '/webhdfs/v1' + path for path in
+            ('/test/inval/a?op=GETFILESTATUS',
+             '/test/inval?op=LISTSTATUS',
+             '/test/other?op=GETFILESTATUS')]
+
+    cache = ResponseCache(ttl=60)
+    for url in urls:
+        cache.fetch(requests.request, 'GET', url)
+    assert len(cache) == 3
+
+    # a change drops the entries under and above its path, not the others
+    cache.fetch(requests.request, 'PUT',
+                urls[0].replace('GETFILESTATUS',
+                                'SETPERMISSION&permission=600'))
+    assert len(cache) == 1
+    resp = cache.fetch(requests.request, 'GET', urls[0])
+    assert resp.json()['FileStatus']['permission'] == '600'
+    cache.fetch(requests.request, 'GET', urls[2])
+    assert cache.hits == 1
+
+
+def test_cassette_round_trip(g_mock, tmp_path):
+    g_mock.mkfile('/test/tape/a', b'0123456789')
+    g_mock.mkfile('/test/tape/b', bytes(range(256)))
+    cassette = str(tmp_path / 'hdfs.jsonl.gz')
+
+    def session(hdfs):
+        return (hdfs.stat('/test/tape/a')['length'],
+                [fs['pathSuffix'] for fs in hdfs.ls('/test/tape')],
+                hdfs.read('/test/tape/b', 0, 256))
+
+    recorder = HdfsServer(Opts(g_mock, record=cassette))
+    recorded = session(recorder)
+    assert recorded == (10, ['a', 'b'], bytes(range(256)))
+    assert recorder.cassette.count > 0
+
+    # served from the cassette only, nothing listens on that port
+    requests_sent = g_mock.requests
+    player = HdfsServer(Opts(g_mock, port=9, replay=cassette))
+    assert session(player) == recorded
+    assert player.cassette.missed == 0
+    assert g_mock.requests == requests_sent
+
+    # not recorded, no response
+    player.do_retry('off')
+    assert player.stat('/test/tape/c') is None
+    assert player.cassette.missed == 1